@@ -0,0 +1,76 @@
+"""Бенчмарк накладных расходов process_update на пути голоса: создание CallbackContext
+и refresh_data против общего контекста для обработчиков с context_light.
+
+Обработчики повторяют бот: справочник имен (TypeHandler в группе -1) и
+CallbackDataRouter с маршрутом "vote_". Сами обработчики ничего не делают, поэтому
+замер - это только выбор обработчиков и подготовка контекста на одно нажатие
+(разобранное через decode_update). Сравниваются Application из PTB,
+DispatchApplication без отметок и DispatchApplication с отметками context_light.
+
+Запуск: python -m benchmarks.bench_context [обновлений на замер]
+"""
+import asyncio
+import gc
+import sys
+import time
+
+from telegram import Update
+from telegram.ext import Application, TypeHandler
+
+from benchmarks.bench_dispatch import tap
+from dispatch import CallbackDataRouter, DispatchApplication, context_light
+
+ROUNDS = 10
+
+
+def build(application_class, light: bool) -> Application:
+    # Функции свои у каждого Application: context_light ставит отметку на саму функцию
+    async def remember_user(update, context) -> None:
+        pass
+
+    async def handle_vote(update, context) -> None:
+        pass
+
+    mark = context_light if light else (lambda callback: callback)
+    application = Application.builder().application_class(application_class).token("123456:TEST").build()
+    application.add_handler(TypeHandler(Update, mark(remember_user)), group=-1)
+    application.add_handler(CallbackDataRouter().add_prefix("vote_", mark(handle_vote)))
+    # Без getMe: сеть не нужна
+    application._initialized = True
+    return application
+
+
+async def per_update_us(application: Application, count: int) -> float:
+    """Микросекунд на обработку одного нового нажатия (сборщик мусора отключен)"""
+    # Каждое обновление новое, как в боте: effective_chat/effective_user еще не вычислены
+    updates = [tap(application.bot, "vote_yes") for _ in range(count)]
+    gc.collect()
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        for update in updates:
+            await application.process_update(update)
+        return (time.perf_counter() - start) / count * 1e6
+    finally:
+        gc.enable()
+
+
+async def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    applications = {
+        "Application": build(Application, light=False),
+        "DispatchApplication": build(DispatchApplication, light=False),
+        "context_light": build(DispatchApplication, light=True),
+    }
+    best = dict.fromkeys(applications, float("inf"))
+    # Варианты чередуются, чтобы фоновая нагрузка влияла на все одинаково
+    for _ in range(ROUNDS):
+        for name, application in applications.items():
+            best[name] = min(best[name], await per_update_us(application, count))
+    print(f"{'':20} {'на нажатие':>14}")
+    for name, us in best.items():
+        print(f"{name:20} {us:10.2f} мкс")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
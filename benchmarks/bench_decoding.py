@@ -0,0 +1,125 @@
+"""Бенчмарк разбора обновлений: полный Update.de_json против decode_update.
+
+Для нажатия кнопки голосования (сообщение с текстом опроса, сущностями и клавиатурой)
+и для текстового сообщения в группе замеряются микросекунды и выделения памяти на одно
+обновление: только разбор и разбор вместе с обращениями, которые делает бот при голосе
+(автор, callback_data, message_id, чат) или при текстовом сообщении.
+
+Запуск: python -m benchmarks.bench_decoding [повторов для tracemalloc]
+"""
+import json
+import sys
+import timeit
+import tracemalloc
+
+from telegram import Update
+from telegram.ext import ExtBot
+
+from decoding import decode_update
+from keyboards import POLL_KEYBOARD_JSON
+from rendering import format_poll_with_results
+from voting import PollRegistry
+
+
+def poll_message() -> dict:
+    """Сообщение голосования на 30 участников, как его присылает Telegram"""
+    poll = PollRegistry().create(-100, "Тренировка")
+    for user_id in range(30):
+        poll.cast_vote(user_id, f"@user{user_id}", ("yes", "no", "reserve")[user_id % 3])
+    text = format_poll_with_results(poll)
+    # Жирные заголовки из HTML приходят сущностями
+    entities = [{"type": "bold", "offset": offset, "length": 10} for offset in range(0, len(text) // 2, 60)]
+    return {
+        "message_id": 42,
+        "from": {"id": 123456, "is_bot": True, "first_name": "Bot", "username": "poll_bot"},
+        "chat": {"id": -100, "type": "supergroup", "title": "Чат"},
+        "date": 1700000000,
+        "edit_date": 1700000100,
+        "text": text,
+        "entities": entities,
+        "reply_markup": json.loads(POLL_KEYBOARD_JSON),
+    }
+
+
+def callback_update() -> dict:
+    return {
+        "update_id": 1,
+        "callback_query": {
+            "id": "1",
+            "from": {"id": 777, "is_bot": False, "first_name": "Тест", "username": "user777"},
+            "chat_instance": "1",
+            "data": "vote_yes",
+            "message": poll_message(),
+        },
+    }
+
+
+def text_update() -> dict:
+    return {
+        "update_id": 2,
+        "message": {
+            "message_id": 43,
+            "from": {"id": 777, "is_bot": False, "first_name": "Тест", "username": "user777"},
+            "chat": {"id": -100, "type": "supergroup", "title": "Чат"},
+            "date": 1700000000,
+            "text": "Кто сегодня идет? Я могу взять мяч",
+        },
+    }
+
+
+def vote_path(update: Update) -> None:
+    """Обращения к обновлению на пути голоса"""
+    query = update.callback_query
+    assert query.data and query.from_user.id
+    assert query.message.message_id and update.effective_chat.id and update.effective_message
+
+
+def text_path(update: Update) -> None:
+    message = update.effective_message
+    # Проверка команды в CommandHandler и фильтр TEXT & ~COMMAND
+    assert update.effective_user.id and message.text and not message.entities
+
+
+def per_update_us(func) -> float:
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=5, number=number)) / number * 1e6
+
+
+def allocations(func, repeat: int) -> tuple:
+    """(блоков, байт) выделений на одно обновление, пока обновления живы"""
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    kept = [func() for _ in range(repeat)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    stats = after.compare_to(before, "filename")
+    blocks = sum(stat.count_diff for stat in stats)
+    size = sum(stat.size_diff for stat in stats)
+    del kept
+    return blocks / repeat, size / repeat
+
+
+def main() -> None:
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    bot = ExtBot("123456:TEST")
+    cases = {"нажатие кнопки": (callback_update(), vote_path), "текст в группе": (text_update(), text_path)}
+    decoders = {"Update.de_json": Update.de_json, "decode_update": decode_update}
+
+    print(f"{'':16} {'разбор':>22} {'разбор + обращения':>22} {'блоков':>8} {'байт':>8}")
+    for case, (data, path) in cases.items():
+        for name, decode in decoders.items():
+            parse = per_update_us(lambda: decode(data, bot))
+            full = per_update_us(lambda: path(decode(data, bot)))
+
+            def handled():
+                update = decode(data, bot)
+                path(update)
+                return update
+
+            blocks, size = allocations(handled, repeat)
+            print(f"{case:16} {name:15} {parse:6.1f} мкс {full:14.1f} мкс {blocks:8.0f} {size:8.0f}")
+
+
+if __name__ == "__main__":
+    main()
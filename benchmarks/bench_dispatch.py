@@ -0,0 +1,97 @@
+"""Бенчмарк выбора обработчика нажатия: CallbackQueryHandler с регулярными выражениями
+против CallbackDataRouter при 9 и 100 маршрутах.
+
+Повторяется то, что делает Application.process_update с группой обработчиков: копия
+списка и check_update по очереди до первого совпадения. Замеряется нажатие кнопки,
+зарегистрированной первой, и "vote_yes", зарегистрированной последней (как в боте).
+
+Запуск: python -m benchmarks.bench_dispatch
+"""
+import timeit
+
+from telegram.ext import CallbackQueryHandler, ExtBot
+
+from decoding import decode_update
+from dispatch import CallbackDataRouter
+
+# Маршруты бота в порядке регистрации: (шаблон CallbackQueryHandler, точный ключ, префикс)
+BOT_ROUTES = [
+    ("^create_poll$", "create_poll", None),
+    (r"^show_results(:\d+)?$", "show_results", "show_results:"),
+    (r"^show_stats(:\d+)?$", "show_stats", "show_stats:"),
+    ("^share_results$", "share_results", None),
+    ("^back_to_poll$", "back_to_poll", None),
+    ("^finish_poll$", "finish_poll", None),
+    ("^add_guests$", "add_guests", None),
+]
+SIZES = (9, 100)
+
+
+async def callback(update, context) -> None:
+    pass
+
+
+def routes(size: int) -> list:
+    """size маршрутов: маршруты бота, дополненные кнопками action_N, и "vote_" последним"""
+    extra = [(f"^action_{i}$", f"action_{i}", None) for i in range(size - len(BOT_ROUTES) - 2)]
+    return BOT_ROUTES + extra + [("^vote_", None, "vote_")]
+
+
+def regex_handlers(size: int) -> list:
+    return [CallbackQueryHandler(callback, pattern=pattern) for pattern, _, _ in routes(size)]
+
+
+def router_handlers(size: int) -> list:
+    router = CallbackDataRouter()
+    for _, key, prefix in routes(size):
+        if key is not None:
+            router.add(key, callback)
+        if prefix is not None:
+            router.add_prefix(prefix, callback)
+    return [router]
+
+
+def select(handlers: list, update) -> object:
+    """Выбор обработчика, как в Application.process_update"""
+    for handler in handlers.copy():
+        check = handler.check_update(update)
+        if check is not None and check is not False:
+            return handler
+    return None
+
+
+def tap(bot, data: str):
+    return decode_update({
+        "update_id": 1,
+        "callback_query": {
+            "id": "1",
+            "from": {"id": 777, "is_bot": False, "first_name": "Тест"},
+            "chat_instance": "1",
+            "data": data,
+            "message": {"message_id": 42, "date": 1700000000, "text": "🗳️",
+                        "chat": {"id": -100, "type": "supergroup", "title": "Чат"}},
+        },
+    }, bot)
+
+
+def per_call_us(func) -> float:
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=5, number=number)) / number * 1e6
+
+
+def main() -> None:
+    bot = ExtBot("123456:TEST")
+    taps = {"create_poll": tap(bot, "create_poll"), "vote_yes": tap(bot, "vote_yes")}
+    print(f"{'маршрутов':>10} {'нажатие':>12} {'регулярные выражения':>22} {'CallbackDataRouter':>20}")
+    for size in SIZES:
+        regex, router = regex_handlers(size), router_handlers(size)
+        for name, update in taps.items():
+            assert select(regex, update) is not None and select(router, update) is not None
+            slow = per_call_us(lambda: select(regex, update))
+            fast = per_call_us(lambda: select(router, update))
+            print(f"{size:>10} {name:>12} {slow:18.2f} мкс {fast:16.2f} мкс")
+
+
+if __name__ == "__main__":
+    main()
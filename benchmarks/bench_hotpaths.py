@@ -0,0 +1,150 @@
+"""Микробенчмарки горячих путей: отрисовка голосования и результатов, перенос голоса,
+изменение гостей и сортировка статистики курятника при 10, 100, 1 000 и 10 000 голосующих.
+
+Запуск:
+    python -m benchmarks.bench_hotpaths                      - замер и вывод
+    python -m benchmarks.bench_hotpaths --save [файл]        - сохранить замер как базовый (JSON)
+    python -m benchmarks.bench_hotpaths --compare [файл]     - сравнить с базовым, код 1 при регрессии
+    --budget 0.2 - допустимое замедление относительно базового (по умолчанию 20%)
+    --min-delta 2 - замедления меньше стольких микросекунд считаются шумом
+
+Базовый замер (benchmarks/baseline_hotpaths.json) зависит от машины: перед
+сравнением на другой машине сохраните его там заново с кода до изменений.
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import sys
+import timeit
+from typing import Callable, Dict
+
+from rendering import format_poll_with_results, format_results, format_stats, stats_page
+from voting import PollRegistry
+
+SIZES = (10, 100, 1000, 10000)
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline_hotpaths.json")
+
+
+def make_poll(voters: int):
+    """Голосование с заданным числом голосующих: 60% "Буду" (треть с гостями), курятник из 5%"""
+    rng = random.Random(voters)
+    poll = PollRegistry().create(-1, "Тренировка")
+    poll.message_id = 1
+    for user_id in range(voters):
+        vote_type = rng.choices(("yes", "no", "reserve"), (0.6, 0.25, 0.15))[0]
+        poll.cast_vote(user_id, f"@user{user_id}", vote_type)
+        if vote_type == "yes" and user_id % 3 == 0:
+            poll.set_guests(user_id, 1 + user_id % 4)
+        elif vote_type == "no" and user_id % 5 == 0:
+            poll.add_to_chicken_coop(user_id)
+    return poll
+
+
+def vote_move(poll, user_id: int, vote_type: str) -> None:
+    """Логика handle_vote без обращений к API: переход "Буду" -> "Не буду" отправляет в курятник"""
+    if poll.current_vote(user_id) == "yes" and vote_type == "no":
+        poll.add_to_chicken_coop(user_id)
+    poll.cast_vote(user_id, f"@user{user_id}", vote_type)
+
+
+def cases(voters: int) -> Dict[str, Callable[[], object]]:
+    """Замеряемые операции; каждая повторяет реальный сценарий нажатия"""
+    poll = make_poll(voters)
+    mover = voters // 2
+    guest_id = voters + 1
+    flip = itertools.cycle(("yes", "no"))
+    guest = itertools.cycle(range(4))
+    poll.cast_vote(guest_id, "@guest", "yes")
+
+    stats = {i: 1 + (i * 7919) % 50 for i in range(voters)}
+    names = {i: f"@user{i}" for i in range(voters)}
+
+    def render_after_vote():
+        vote_move(poll, mover, next(flip))
+        return format_poll_with_results(poll)
+
+    def stats_first_page():
+        entries, page, pages = stats_page(stats, 0)
+        return format_stats(entries, names, page, pages)
+
+    def results_after_vote():
+        vote_move(poll, mover, next(flip))
+        return format_results(poll)
+
+    return {
+        "format_poll_with_results": render_after_vote,
+        "format_results": results_after_vote,
+        "vote_move": lambda: vote_move(poll, mover, next(flip)),
+        "set_guests": lambda: poll.set_guests(guest_id, next(guest)),
+        "format_stats": stats_first_page,
+    }
+
+
+def measure(func: Callable[[], object], repeat: int = 7) -> float:
+    """Лучшее время одной операции в микросекундах"""
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number * 1e6
+
+
+def run() -> Dict[str, float]:
+    results = {}
+    for voters in SIZES:
+        for name, func in cases(voters).items():
+            results[f"{name}/{voters}"] = measure(func)
+    return results
+
+
+def compare(results: Dict[str, float], baseline: Dict[str, float], budget: float, min_delta: float) -> bool:
+    """Вывести сравнение; True, если ни одна операция не замедлилась больше бюджета"""
+    ok = True
+    for key, value in results.items():
+        base = baseline.get(key)
+        if base is None:
+            print(f"{key:36} {value:12.2f} мкс   (нет в базовом замере)")
+            continue
+        change = value / base - 1
+        flag = ""
+        if change > budget and value - base > min_delta:
+            flag = "  РЕГРЕССИЯ"
+            ok = False
+        print(f"{key:36} {value:12.2f} мкс   базовый {base:12.2f}   {change:+7.1%}{flag}")
+    return ok
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Микробенчмарки отрисовки и изменения голосов")
+    parser.add_argument("--save", nargs="?", const=DEFAULT_BASELINE, help="сохранить замер как базовый")
+    parser.add_argument("--compare", nargs="?", const=DEFAULT_BASELINE, help="сравнить с базовым замером")
+    parser.add_argument("--budget", type=float, default=0.2, help="допустимое замедление (0.2 = 20%%)")
+    parser.add_argument("--min-delta", type=float, default=2.0, help="порог шума, мкс")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        # Базовый замер читается до замера: без него сравнивать не с чем
+        try:
+            with open(args.compare, encoding="utf-8") as f:
+                baseline = json.load(f)
+        except (OSError, ValueError) as e:
+            sys.exit(f"Не удалось прочитать базовый замер {args.compare}: {e}\n"
+                     f"Сохраните его командой: python -m benchmarks.bench_hotpaths --save")
+
+    results = run()
+    if baseline is not None:
+        if not compare(results, baseline, args.budget, args.min_delta):
+            print(f"Есть операции медленнее базового замера больше чем на {args.budget:.0%}")
+            sys.exit(1)
+    else:
+        for key, value in results.items():
+            print(f"{key:36} {value:12.2f} мкс")
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"Базовый замер сохранен в {args.save}")
+
+
+if __name__ == "__main__":
+    main()
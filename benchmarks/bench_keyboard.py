@@ -0,0 +1,69 @@
+"""Микробенчмарк клавиатуры голосования: сборка на каждое нажатие против общей готовой.
+
+Запуск: python -m benchmarks.bench_keyboard
+"""
+import timeit
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.request import RequestData
+from telegram.request._requestparameter import RequestParameter
+
+from keyboards import POLL_KEYBOARD_JSON
+from rendering import (
+    EMOJI_YES,
+    EMOJI_NO,
+    EMOJI_RESERVE,
+    EMOJI_YES_PLUS,
+    EMOJI_STATS,
+    EMOJI_SHARE,
+    EMOJI_RESULTS,
+    EMOJI_FINISH
+)
+
+
+def build_poll_keyboard() -> InlineKeyboardMarkup:
+    """Прежний вариант: 8 кнопок создаются заново на каждый вызов"""
+    return InlineKeyboardMarkup([
+        [
+            InlineKeyboardButton(f"{EMOJI_YES} Буду", callback_data="vote_yes"),
+            InlineKeyboardButton(f"{EMOJI_NO} Не буду", callback_data="vote_no")
+        ],
+        [
+            InlineKeyboardButton(f"{EMOJI_RESERVE} Резерв", callback_data="vote_reserve"),
+            InlineKeyboardButton(f"{EMOJI_YES_PLUS} Буду с гостями", callback_data="add_guests")
+        ],
+        [
+            InlineKeyboardButton(f"{EMOJI_RESULTS} Результаты", callback_data="show_results"),
+            InlineKeyboardButton(f"{EMOJI_STATS} Статистика", callback_data="show_stats")
+        ],
+        [
+            InlineKeyboardButton(f"{EMOJI_SHARE} Поделиться", callback_data="share_results"),
+            InlineKeyboardButton(f"{EMOJI_FINISH} Завершить", callback_data="finish_poll")
+        ]
+    ])
+
+
+def encode_reply_markup(reply_markup) -> str:
+    """Кодирование параметра так же, как PTB делает это перед отправкой запроса"""
+    return RequestData([RequestParameter.from_input("reply_markup", reply_markup)]).json_parameters["reply_markup"]
+
+
+def per_tap_build() -> str:
+    return encode_reply_markup(build_poll_keyboard())
+
+
+def shared_json() -> str:
+    return encode_reply_markup(POLL_KEYBOARD_JSON)
+
+
+def main() -> None:
+    assert per_tap_build() == shared_json()
+
+    number = 20000
+    for name, func in (("сборка на каждое нажатие", per_tap_build), ("общий JSON", shared_json)):
+        best = min(timeit.repeat(func, number=number, repeat=5))
+        print(f"{name:>26}: {best / number * 1e6:8.2f} мкс/вызов")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""Бенчмарк памяти: голоса и статистика курятника в текущем представлении и в прежнем
+(кортежи (имя, гости, datetime) по строковым id, индекс кортежей и vote_history).
+
+Запуск: python -m benchmarks.bench_memory [количество записей]
+"""
+import random
+import sys
+import tracemalloc
+from datetime import datetime
+
+from voting import PollRegistry
+
+# Уникальных имен меньше, чем голосующих: один человек голосует в разных опросах
+NAMES = 5000
+
+
+def build_current(records: int):
+    registry = PollRegistry()
+    poll = registry.create(-1, "Тренировка")
+    rng = random.Random(records)
+    for i in range(records):
+        user_id = 10 ** 9 + i
+        # Имена приходят из Telegram новыми строками при каждом обновлении
+        poll.cast_vote(user_id, "".join(["@user", str(i % NAMES)]), rng.choice(("yes", "no", "reserve")))
+        poll.chicken_coop_stats[user_id] = 1 + i % 7
+    return registry
+
+
+def build_legacy(records: int):
+    votes = {"yes": {}, "no": {}, "reserve": {}}
+    voters = {}
+    vote_history = {}
+    coop_stats = {}
+    rng = random.Random(records)
+    for i in range(records):
+        user_id = str(10 ** 9 + i)
+        vote_type = rng.choice(("yes", "no", "reserve"))
+        votes[vote_type][user_id] = ("".join(["@user", str(i % NAMES)]), 0, datetime.now())
+        voters[user_id] = (vote_type, 0, i)
+        vote_history[user_id] = vote_type
+        coop_stats[user_id] = 1 + i % 7
+    return votes, voters, vote_history, coop_stats
+
+
+def measure(build, records: int) -> int:
+    tracemalloc.start()
+    state = build(records)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del state
+    return size
+
+
+def main() -> None:
+    records = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    current = measure(build_current, records)
+    legacy = measure(build_legacy, records)
+    print(f"{records} голосов и записей статистики курятника:")
+    print(f"  прежнее представление: {legacy / 2 ** 20:7.1f} МБ ({legacy / records:5.0f} байт на голос)")
+    print(f"  текущее представление: {current / 2 ** 20:7.1f} МБ ({current / records:5.0f} байт на голос)")
+    print(f"  экономия: {1 - current / legacy:.0%}")
+
+
+if __name__ == "__main__":
+    main()
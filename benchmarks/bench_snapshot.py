@@ -0,0 +1,66 @@
+"""Бенчмарк Application.process_update: копии списков обработчиков против снимка
+DispatchApplication при 10, 100 и 1000 обработчиках.
+
+Обработчики разложены по GROUPS группам; в каждой группе обновление совпадает с первым
+обработчиком, поэтому check_update вызывается по разу на группу и разница во времени -
+это стоимость копирования списков, которую снимок убирает. Сеть не используется:
+Application помечается инициализированным без getMe.
+
+Запуск: python -m benchmarks.bench_snapshot [обновлений на замер]
+"""
+import asyncio
+import sys
+import time
+
+from telegram import Update
+from telegram.ext import Application, TypeHandler
+
+from dispatch import DispatchApplication
+
+SIZES = (10, 100, 1000)
+GROUPS = 5
+ROUNDS = 10
+
+
+class Unused:
+    """Тип, которого нет среди обновлений: обработчики-заполнители не совпадают никогда"""
+
+
+async def callback(update, context) -> None:
+    pass
+
+
+def build(application_class, size: int) -> Application:
+    application = Application.builder().application_class(application_class).token("123456:TEST").build()
+    for group in range(GROUPS):
+        application.add_handler(TypeHandler(Update, callback), group)
+        for _ in range(size // GROUPS - 1):
+            application.add_handler(TypeHandler(Unused, callback), group)
+    application._initialized = True
+    return application
+
+
+async def per_update_us(application: Application, update: Update, count: int) -> float:
+    start = time.perf_counter()
+    for _ in range(count):
+        await application.process_update(update)
+    return (time.perf_counter() - start) / count * 1e6
+
+
+async def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    update = Update(update_id=1)
+    print(f"{'обработчиков':>12} {'Application':>14} {'DispatchApplication':>20}")
+    for size in SIZES:
+        applications = (build(Application, size), build(DispatchApplication, size))
+        best = [float("inf")] * len(applications)
+        # Варианты чередуются, чтобы фоновая нагрузка влияла на оба одинаково
+        for _ in range(ROUNDS):
+            for index, application in enumerate(applications):
+                best[index] = min(best[index], await per_update_us(application, update, count))
+        copies, snapshot = best
+        print(f"{size:>12} {copies:10.2f} мкс {snapshot:16.2f} мкс")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
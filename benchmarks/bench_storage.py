@@ -0,0 +1,118 @@
+"""Бенчмарк долговременного хранения: фоновая запись голосов в SQLite при постоянном потоке голосов.
+
+Голоса подаются равномерно с заданной частотой (голосов в секунду), как их присылали
+бы обработчики, а не одной пачкой. Для каждой частоты выводятся транзакции в секунду,
+операций на транзакцию, среднее время транзакции (с fsync) и задержка от голоса до
+фиксации на диске (p50/p99): отдельный поток периодически вызывает flush() и замеряет,
+сколько ждут поставленные к этому моменту изменения. Частота 0 - без ограничения
+(цикл голосов без пауз почти не отдает GIL потоку записи - это предел, а не рабочий режим).
+
+Запуск: python -m benchmarks.bench_storage [секунд на частоту] [частота ...]
+"""
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+from storage import PollStorage
+from voting import PollRegistry
+
+CHATS = 100
+USERS = 300
+RATES = (1000, 10000, 30000)
+# Как часто поток замера задержки ставит flush() в очередь
+PROBE_INTERVAL = 0.02
+
+
+def make_voter(registry: PollRegistry):
+    """Функция одного голоса (логика handle_vote) по CHATS голосованиям"""
+    rng = random.Random(42)
+    polls = []
+    for chat_id in range(CHATS):
+        poll = registry.create(-chat_id, f"Голосование {chat_id}")
+        registry.attach_message(poll, 1)
+        polls.append(poll)
+
+    def vote() -> None:
+        poll = polls[rng.randrange(CHATS)]
+        user_id = rng.randrange(USERS)
+        vote_type = rng.choice(("yes", "no", "reserve"))
+        previous_vote = poll.current_vote(user_id)
+        if previous_vote == vote_type:
+            return
+        if previous_vote == "yes" and vote_type == "no":
+            poll.add_to_chicken_coop(user_id)
+        poll.cast_vote(user_id, f"user{user_id}", vote_type)
+    return vote
+
+
+def percentile(values: list, fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))] if values else 0.0
+
+
+def run(rate: int, duration: float) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        storage = PollStorage(os.path.join(tmp, "polls.db"))
+        storage.start()
+        vote = make_voter(PollRegistry(store=storage))
+        latencies = []
+        stop = threading.Event()
+
+        def probe() -> None:
+            while not stop.is_set():
+                started = time.perf_counter()
+                storage.flush()
+                latencies.append(time.perf_counter() - started)
+                stop.wait(PROBE_INTERVAL)
+
+        prober = threading.Thread(target=probe)
+        prober.start()
+        votes = 0
+        start = time.perf_counter()
+        while True:
+            elapsed = time.perf_counter() - start
+            if elapsed >= duration:
+                break
+            if rate:
+                # Голоса, которые должны были прийти к этому моменту; дальше - пауза на 1 мс
+                due = int(elapsed * rate)
+                while votes < due:
+                    vote()
+                    votes += 1
+                time.sleep(0.001)
+            else:
+                for _ in range(100):
+                    vote()
+                votes += 100
+        storage.flush()
+        total = time.perf_counter() - start
+        stop.set()
+        prober.join()
+        storage.close()
+    return {
+        "votes_per_second": votes / total,
+        "commits_per_second": storage.commits / total,
+        "ops_per_commit": storage.written / max(storage.commits, 1),
+        "commit_ms": storage.commit_seconds / max(storage.commits, 1) * 1000,
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+
+
+def main() -> None:
+    duration = float(sys.argv[1]) if len(sys.argv) > 1 else 3.0
+    rates = [int(rate) for rate in sys.argv[2:]] or RATES
+    print(f"{'частота':>10} {'голосов/с':>10} {'транзакций/с':>13} {'операций':>9} "
+          f"{'транзакция':>11} {'до диска p50':>13} {'p99':>8}")
+    for rate in rates:
+        result = run(rate, duration)
+        print(f"{rate or 'макс.':>10} {result['votes_per_second']:10.0f} {result['commits_per_second']:13.0f} "
+              f"{result['ops_per_commit']:9.1f} {result['commit_ms']:8.2f} мс "
+              f"{result['p50_ms']:10.2f} мс {result['p99_ms']:5.1f} мс")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Бенчмарк вебхук-сервера: обновлений в секунду через keep-alive соединения с конвейером запросов.
+
+Запуск: python -m benchmarks.bench_webhook [соединений] [запросов на соединение]
+"""
+import asyncio
+import json
+import sys
+import time
+from types import SimpleNamespace
+
+from webhook import WebhookServer
+
+SECRET = "bench-secret"
+
+
+def callback_update(update_id: int) -> bytes:
+    """Типичное обновление: нажатие кнопки голосования"""
+    user = {"id": 1000 + update_id % 500, "is_bot": False, "first_name": "Тест", "username": f"user{update_id % 500}"}
+    return json.dumps({
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": user,
+            "chat_instance": "1",
+            "data": "vote_yes",
+            "message": {
+                "message_id": 42,
+                "date": 1700000000,
+                "chat": {"id": -100, "type": "supergroup", "title": "Чат"},
+                "text": "🗳️ Голосование",
+            },
+        },
+    }).encode()
+
+
+def request(body: bytes) -> bytes:
+    return (b"POST /telegram HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+            b"X-Telegram-Bot-Api-Secret-Token: " + SECRET.encode() + b"\r\n"
+            b"Content-Length: " + str(len(body)).encode() + b"\r\n\r\n" + body)
+
+
+async def client(port: int, payload: bytes, requests: int) -> None:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(payload)
+    await writer.drain()
+    for _ in range(requests):
+        status = await reader.readline()
+        assert status.startswith(b"HTTP/1.1 200"), status
+        while await reader.readline() != b"\r\n":
+            pass
+    writer.close()
+
+
+async def main() -> None:
+    connections = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    requests = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+
+    application = SimpleNamespace(update_queue=asyncio.Queue(), bot=None)
+    server = WebhookServer(application, "127.0.0.1", 0, "/telegram", SECRET)
+    await server.start()
+
+    payloads = [b"".join(request(callback_update(c * requests + i)) for i in range(requests))
+                for c in range(connections)]
+    start = time.perf_counter()
+    await asyncio.gather(*(client(server.port, payload, requests) for payload in payloads))
+    elapsed = time.perf_counter() - start
+    await server.stop()
+
+    total = connections * requests
+    assert application.update_queue.qsize() == total
+    print(f"{total} обновлений за {elapsed:.2f} с: {total / elapsed:.0f} обновлений/с "
+          f"({connections} соединений, конвейер по {requests} запросов)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,330 @@
+"""Локальная замена Bot API для интеграционных и нагрузочных тестов без api.telegram.org.
+
+Поддерживаются методы, которые использует бот: getMe, getUpdates, sendMessage,
+editMessageText, answerCallbackQuery, getChat (и служебные deleteWebhook/setWebhook).
+Сервер хранит отправленные сообщения, умеет добавлять задержку и случайные ошибки
+429 (RetryAfter) и 5xx, и записывает каждый вызов.
+
+Подключение:
+    api = FakeBotApi()
+    await api.start()
+    application = Application.builder().token(api.token).base_url(api.base_url).build()
+    api.push_update(api.callback_update(chat_id, message_id, user_id, "vote_yes"))
+
+Запуск отдельным процессом: python -m benchmarks.fake_api [порт]
+"""
+import asyncio
+import json
+import random
+import sys
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+from urllib.parse import parse_qsl
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 429: "Too Many Requests",
+            500: "Internal Server Error", 502: "Bad Gateway"}
+
+# Параметры, которые PTB передает строками без JSON-кодирования
+_STRING_FIELDS = {"text", "parse_mode", "callback_query_id", "inline_message_id", "url", "secret_token",
+                  "title", "first_name", "last_name", "username"}
+
+
+@dataclass
+class Faults:
+    """Вероятности и параметры внедряемых сбоев"""
+    rate_limit: float = 0.0  # доля ответов 429
+    retry_after: int = 1  # retry_after в ответе 429
+    server_error: float = 0.0  # доля ответов 502
+    latency: float = 0.0  # задержка каждого ответа, сек.
+    jitter: float = 0.0  # случайная добавка к задержке, сек.
+    methods: Optional[set] = None  # методы, к которым применяются сбои (None - все, кроме getUpdates)
+
+
+@dataclass
+class Call:
+    """Запись об одном вызове API"""
+    started: float
+    method: str
+    params: dict
+    status: int
+    duration: float = 0.0
+
+
+@dataclass
+class _Chat:
+    chat: dict
+    messages: Dict[int, dict] = field(default_factory=dict)
+    next_message_id: int = 1
+
+
+class FakeBotApi:
+    """HTTP-сервер на asyncio streams, отвечающий как Bot API"""
+
+    def __init__(self, token: str = "123456:TEST", host: str = "127.0.0.1", port: int = 0,
+                 faults: Optional[Faults] = None, seed: int = 0):
+        self.token = token
+        self.host = host
+        self.port = port
+        self.faults = faults or Faults()
+        self.random = random.Random(seed)
+        bot_id = int(token.split(":", 1)[0])
+        self.bot_user = {"id": bot_id, "is_bot": True, "first_name": "Fake", "username": "fake_bot"}
+        self.calls: List[Call] = []
+        self.counts: Counter = Counter()
+        self.on_call: Optional[Callable[[Call], None]] = None  # вызывается после ответа на каждый запрос
+        self._chats: Dict[int, _Chat] = {}
+        self._updates: List[dict] = []
+        self._next_update_id = 1
+        self._new_updates = asyncio.Condition()
+        self._server = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/bot"
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    # Состояние
+
+    def chat(self, chat_id: int) -> dict:
+        """Чат по id; отрицательные id - группы, положительные - личные чаты"""
+        state = self._chats.get(chat_id)
+        if state is None:
+            if chat_id < 0:
+                chat = {"id": chat_id, "type": "supergroup", "title": f"Группа {-chat_id}"}
+            else:
+                chat = {"id": chat_id, "type": "private", "first_name": f"Пользователь {chat_id}"}
+            state = self._chats[chat_id] = _Chat(chat)
+        return state.chat
+
+    def message(self, chat_id: int, message_id: int) -> Optional[dict]:
+        state = self._chats.get(chat_id)
+        return state.messages.get(message_id) if state else None
+
+    def messages(self, chat_id: int) -> List[dict]:
+        state = self._chats.get(chat_id)
+        return list(state.messages.values()) if state else []
+
+    def reset_calls(self) -> None:
+        self.calls.clear()
+        self.counts.clear()
+
+    # Входящие обновления
+
+    def push_update(self, update: dict) -> int:
+        """Поставить обновление в очередь getUpdates; update_id назначается сервером"""
+        update = dict(update, update_id=self._next_update_id)
+        self._next_update_id += 1
+        self._updates.append(update)
+        asyncio.ensure_future(self._notify())
+        return update["update_id"]
+
+    async def _notify(self) -> None:
+        async with self._new_updates:
+            self._new_updates.notify_all()
+
+    @staticmethod
+    def user(user_id: int) -> dict:
+        return {"id": user_id, "is_bot": False, "first_name": f"Игрок{user_id}", "username": f"user{user_id}"}
+
+    def text_update(self, chat_id: int, user_id: int, text: str) -> dict:
+        """Текстовое сообщение пользователя в чат"""
+        self.chat(chat_id)
+        state = self._chats[chat_id]
+        message = {"message_id": state.next_message_id, "date": int(time.time()),
+                   "chat": self.chat(chat_id), "from": self.user(user_id), "text": text}
+        state.next_message_id += 1
+        if text.startswith("/"):
+            command = text.split()[0]
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(command)}]
+        return {"message": message}
+
+    def callback_update(self, chat_id: int, message_id: int, user_id: int, data: str) -> dict:
+        """Нажатие inline-кнопки под сообщением бота (с его текущим содержимым)"""
+        message = self.message(chat_id, message_id) or {
+            "message_id": message_id, "date": int(time.time()), "chat": self.chat(chat_id), "text": ""}
+        return {"callback_query": {"id": f"{user_id}-{self._next_update_id}", "from": self.user(user_id),
+                                   "chat_instance": str(chat_id), "data": data, "message": message}}
+
+    # HTTP
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.partition(b":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get(b"content-length", b"0"))
+                body = await reader.readexactly(length) if length else b""
+                path, _, query = target.partition(b"?")
+
+                status, payload = await self._call(path.decode(), self._params(headers, body, query))
+                data = json.dumps(payload, ensure_ascii=False).encode()
+                writer.write(f"HTTP/1.1 {status} {_REASONS[status]}\r\nContent-Type: application/json\r\n"
+                             f"Content-Length: {len(data)}\r\n\r\n".encode("ascii") + data)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        except asyncio.CancelledError:
+            # Остановка цикла во время долгого getUpdates
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    def _params(headers: dict, body: bytes, query: bytes) -> dict:
+        if headers.get(b"content-type", b"").startswith(b"application/json"):
+            return json.loads(body) if body else {}
+        params = {}
+        for key, value in parse_qsl((body or query).decode(), keep_blank_values=True):
+            if key in _STRING_FIELDS:
+                params[key] = value
+                continue
+            try:
+                params[key] = json.loads(value)
+            except ValueError:
+                params[key] = value
+        return params
+
+    async def _call(self, path: str, params: dict) -> tuple:
+        token, _, method = path[len("/bot"):].partition("/")
+        call = Call(time.perf_counter(), method, params, 200)
+        self.calls.append(call)
+        self.counts[method] += 1
+        if not path.startswith("/bot") or token != self.token:
+            call.status, payload = 404, {"ok": False, "error_code": 404, "description": "Not Found"}
+        else:
+            call.status, payload = await self._respond(method, params)
+        call.duration = time.perf_counter() - call.started
+        if self.on_call is not None:
+            self.on_call(call)
+        return call.status, payload
+
+    async def _respond(self, method: str, params: dict) -> tuple:
+        faults = self.faults
+        if (faults.methods is None and method != "getUpdates") or (faults.methods and method in faults.methods):
+            if faults.latency or faults.jitter:
+                await asyncio.sleep(faults.latency + self.random.uniform(0, faults.jitter))
+            roll = self.random.random()
+            if roll < faults.rate_limit:
+                return 429, {"ok": False, "error_code": 429,
+                             "description": f"Too Many Requests: retry after {faults.retry_after}",
+                             "parameters": {"retry_after": faults.retry_after}}
+            if roll < faults.rate_limit + faults.server_error:
+                return 502, {"ok": False, "error_code": 502, "description": "Bad Gateway"}
+
+        handler = getattr(self, f"_api_{method}", None)
+        if handler is None:
+            return 404, {"ok": False, "error_code": 404, "description": "Not Found: method not found"}
+        try:
+            return 200, {"ok": True, "result": await handler(params)}
+        except _ApiError as e:
+            return e.status, {"ok": False, "error_code": e.status, "description": e.description}
+
+    # Методы Bot API
+
+    async def _api_getMe(self, params: dict):
+        return self.bot_user
+
+    async def _api_deleteWebhook(self, params: dict):
+        return True
+
+    async def _api_setWebhook(self, params: dict):
+        return True
+
+    async def _api_getUpdates(self, params: dict):
+        offset = params.get("offset") or 0
+        limit = params.get("limit") or 100
+        timeout = params.get("timeout") or 0
+        # Подтвержденные обновления удаляются, как в настоящем API
+        self._updates = [update for update in self._updates if update["update_id"] >= offset]
+        if not self._updates and timeout:
+            async with self._new_updates:
+                try:
+                    await asyncio.wait_for(self._new_updates.wait_for(lambda: self._updates), timeout)
+                except asyncio.TimeoutError:
+                    pass
+        return self._updates[:limit]
+
+    async def _api_getChat(self, params: dict):
+        # getChat отвечает ChatFullInfo: к краткому описанию чата добавляются обязательные поля
+        return dict(self.chat(int(params["chat_id"])), accent_color_id=0, max_reaction_count=11)
+
+    async def _api_answerCallbackQuery(self, params: dict):
+        return True
+
+    async def _api_sendMessage(self, params: dict):
+        chat_id = int(params["chat_id"])
+        text = params.get("text", "")
+        if not text:
+            raise _ApiError(400, "Bad Request: message text is empty")
+        self.chat(chat_id)
+        state = self._chats[chat_id]
+        message = {"message_id": state.next_message_id, "date": int(time.time()), "chat": state.chat,
+                   "from": self.bot_user, "text": text}
+        if params.get("reply_markup"):
+            message["reply_markup"] = params["reply_markup"]
+        state.next_message_id += 1
+        state.messages[message["message_id"]] = message
+        return message
+
+    async def _api_editMessageText(self, params: dict):
+        chat_id = int(params.get("chat_id", 0))
+        message = self.message(chat_id, int(params.get("message_id", 0)))
+        if message is None:
+            raise _ApiError(400, "Bad Request: message to edit not found")
+        reply_markup = params.get("reply_markup")
+        if message["text"] == params.get("text") and message.get("reply_markup") == reply_markup:
+            raise _ApiError(400, "Bad Request: message is not modified: specified new message content "
+                                 "and reply markup are exactly the same as a current content and reply "
+                                 "markup of the message")
+        message["text"] = params.get("text", "")
+        if reply_markup:
+            message["reply_markup"] = reply_markup
+        else:
+            message.pop("reply_markup", None)
+        message["edit_date"] = int(time.time())
+        return message
+
+
+class _ApiError(Exception):
+    def __init__(self, status: int, description: str):
+        super().__init__(description)
+        self.status = status
+        self.description = description
+
+
+async def main() -> None:
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8081
+    api = FakeBotApi(port=port)
+    await api.start()
+    print(f"Fake Bot API: {api.base_url}, токен {api.token}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        print(dict(api.counts))
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,273 @@
+"""Нагрузочный тест бота целиком: N чатов x M пользователей голосуют через локальную заглушку Bot API.
+
+В каждом чате создается голосование (/start -> "Создать" -> заголовок), затем
+пользователи нажимают vote_yes/vote_no/vote_reserve/add_guests по выбранной форме
+всплеска. Отчет: голосов в секунду, p50/p95/p99 времени от нажатия до первого
+редактирования сообщения после учета голоса, вызовов Bot API на голос и пиковый RSS
+(заглушка работает в том же процессе и тоже входит в RSS).
+
+Формы всплеска (--shape):
+    decay   - большинство нажатий в первые секунды после публикации, затем затухание
+    uniform - нажатия равномерно по всему интервалу
+    spike   - все нажатия одновременно
+
+Запуск: python -m benchmarks.loadgen --chats 20 --users 50 --shape decay --duration 60
+"""
+import argparse
+import asyncio
+import bisect
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional
+
+from benchmarks.fake_api import Call, Faults, FakeBotApi
+
+# Действия пользователей и их доли
+ACTIONS = (("vote_yes", 0.55), ("vote_no", 0.15), ("vote_reserve", 0.15), ("add_guests", 0.15))
+# Служебные методы, не относящиеся к обработке голосов
+SERVICE_METHODS = {"getUpdates", "getMe", "deleteWebhook", "setWebhook"}
+
+
+def burst_offsets(shape: str, count: int, duration: float, rng: random.Random) -> List[float]:
+    """Моменты нажатий (секунды от публикации голосования)"""
+    if shape == "spike":
+        return [0.0] * count
+    if shape == "uniform":
+        return [rng.uniform(0, duration) for _ in range(count)]
+    if shape == "decay":
+        # Экспоненциальное затухание: около 60% нажатий в первую пятую часть интервала
+        return [min(rng.expovariate(5 / duration), duration) for _ in range(count)]
+    raise ValueError(f"Неизвестная форма всплеска: {shape}")
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def peak_rss_mb() -> Optional[float]:
+    try:
+        import resource
+    except ImportError:
+        # Windows
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux отдает килобайты, macOS - байты
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+class LoadGenerator:
+    def __init__(self, api: FakeBotApi, application, bot_module, args):
+        self.api = api
+        self.application = application
+        self.bot = bot_module
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.votes: Dict[str, dict] = {}  # {callback_query_id: {chat_id, message_id, pushed, answered}}
+        self.pending_guests = 0
+
+    def on_call(self, call: Call) -> None:
+        if call.method == "answerCallbackQuery":
+            vote = self.votes.get(call.params.get("callback_query_id"))
+            if vote is not None:
+                vote["answered"] = call.started + call.duration
+        elif (call.method == "sendMessage" and call.status == 200 and int(call.params["chat_id"]) > 0
+              and "Добавление гостей" in call.params.get("text", "")):
+            # Бот спросил в личке количество гостей - отвечаем
+            user_id = int(call.params["chat_id"])
+            self.api.push_update(self.api.text_update(user_id, user_id, str(self.rng.randint(0, 3))))
+            self.pending_guests -= 1
+
+    async def wait_for(self, condition, timeout: float) -> bool:
+        deadline = time.perf_counter() + timeout
+        while not condition():
+            if time.perf_counter() > deadline:
+                return False
+            await asyncio.sleep(0.01)
+        return True
+
+    async def create_polls(self) -> Dict[int, int]:
+        """Создать голосование в каждом чате; возвращает {chat_id: message_id}"""
+        chat_ids = [-(1000 + i) for i in range(self.args.chats)]
+        # У каждого чата свой автор: ожидание заголовка хранится в user_data
+        creators = {chat_id: 1 + i for i, chat_id in enumerate(chat_ids)}
+        for chat_id in chat_ids:
+            self.api.push_update(self.api.text_update(chat_id, creators[chat_id], "/start"))
+        await self.wait_for(lambda: all(self.api.messages(chat_id) for chat_id in chat_ids), 30)
+        for chat_id in chat_ids:
+            start_message = self.api.messages(chat_id)[0]
+            self.api.push_update(self.api.callback_update(chat_id, start_message["message_id"], creators[chat_id],
+                                                          "create_poll"))
+        await self.wait_for(lambda: self.api.counts["editMessageText"] >= len(chat_ids), 30)
+        for chat_id in chat_ids:
+            self.api.push_update(self.api.text_update(chat_id, creators[chat_id], f"Тренировка в чате {-chat_id}"))
+        def created() -> bool:
+            return all(polls and polls[0].message_id for polls in map(self.bot.polls.chat_polls, chat_ids))
+
+        if not await self.wait_for(created, 30):
+            raise RuntimeError("Голосования не созданы за 30 секунд")
+        # Уведомления о новом голосовании отправляются после сообщения голосования
+        await asyncio.sleep(0.5)
+        return {chat_id: self.bot.polls.chat_polls(chat_id)[0].message_id for chat_id in chat_ids}
+
+    def plan(self, poll_messages: Dict[int, int]) -> List[tuple]:
+        """Расписание нажатий: (момент, chat_id, message_id, user_id, callback_data)"""
+        names, weights = zip(*ACTIONS)
+        taps = []
+        for index, (chat_id, message_id) in enumerate(poll_messages.items()):
+            offsets = burst_offsets(self.args.shape, self.args.users, self.args.duration, self.rng)
+            for number, offset in enumerate(offsets):
+                user_id = 100000 + index * self.args.users + number
+                action = self.rng.choices(names, weights)[0]
+                taps.append((offset, chat_id, message_id, user_id, action))
+                # Часть "будущих" передумывает и попадает в курятник
+                if action == "vote_yes" and self.rng.random() < self.args.changes:
+                    later = min(offset + self.rng.uniform(1, 10), self.args.duration)
+                    taps.append((later, chat_id, message_id, user_id, "vote_no"))
+        taps.sort(key=lambda tap: tap[0])
+        return taps
+
+    async def run(self) -> dict:
+        poll_messages = await self.create_polls()
+        taps = self.plan(poll_messages)
+        # Сбои и задержки включаются только на время голосования
+        self.api.faults = Faults(rate_limit=self.args.rate_limit, server_error=self.args.server_errors,
+                                 latency=self.args.latency, jitter=self.args.jitter)
+        self.api.reset_calls()
+        rss_before = peak_rss_mb()
+
+        start = time.perf_counter()
+        for offset, chat_id, message_id, user_id, action in taps:
+            delay = start + offset - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            update = self.api.callback_update(chat_id, message_id, user_id, action)
+            query_id = update["callback_query"]["id"]
+            self.votes[query_id] = {"chat_id": chat_id, "message_id": message_id,
+                                    "pushed": time.perf_counter(), "answered": None}
+            if action == "add_guests":
+                self.pending_guests += 1
+            self.api.push_update(update)
+
+        # Ждем обработки всех нажатий и отправки отложенных редактирований
+        limiter = self.application.bot.rate_limiter
+        await self.wait_for(lambda: all(vote["answered"] for vote in self.votes.values()), 120)
+        last_answer = max((vote["answered"] or 0) for vote in self.votes.values())
+        await self.wait_for(lambda: self.pending_guests <= 0, 30)
+        await self.wait_for(lambda: not self.bot.edit_scheduler.pending() and (limiter is None or not limiter.queued),
+                            300)
+        # Последние запросы могут быть еще в пути
+        await asyncio.sleep(0.5)
+        return self.report(start, last_answer, rss_before)
+
+    def report(self, start: float, last_answer: float, rss_before: Optional[float]) -> dict:
+        edits = defaultdict(list)
+        methods = Counter()
+        for call in self.api.calls:
+            if call.method not in SERVICE_METHODS:
+                methods[call.method] += 1
+            if call.method == "editMessageText":
+                edits[(int(call.params["chat_id"]), int(call.params["message_id"]))].append(call.started)
+
+        latencies = []
+        unmatched = 0
+        for vote in self.votes.values():
+            times = edits.get((vote["chat_id"], vote["message_id"]), [])
+            # Первое редактирование, начатое после того, как бот ответил на нажатие и учел голос
+            i = bisect.bisect_left(times, vote["answered"] or float("inf"))
+            if i < len(times):
+                latencies.append(times[i] - vote["pushed"])
+            else:
+                unmatched += 1
+
+        votes = len(self.votes)
+        limiter = self.application.bot.rate_limiter
+        return {
+            "votes": votes,
+            "votes_per_second": votes / (last_answer - start) if last_answer > start else float("nan"),
+            "p50": percentile(latencies, 0.50),
+            "p95": percentile(latencies, 0.95),
+            "p99": percentile(latencies, 0.99),
+            "without_edit": unmatched,
+            "api_calls_per_vote": sum(methods.values()) / votes if votes else 0,
+            "api_calls": dict(methods),
+            "sent_edits": self.bot.edit_scheduler.sent_edits,
+            "skipped_edits": self.bot.edit_scheduler.skipped_edits,
+            "limiter_max_wait": limiter.max_wait if limiter is not None else None,
+            "limiter_retry_afters": limiter.retry_afters if limiter is not None else None,
+            "peak_rss_mb": peak_rss_mb(),
+            "rss_before_mb": rss_before,
+        }
+
+
+def print_report(report: dict, args) -> None:
+    print(f"{args.chats} чатов x {args.users} пользователей, форма {args.shape}, {args.duration:g} с")
+    print(f"Голосов: {report['votes']}, {report['votes_per_second']:.1f} голосов/с")
+    print(f"Нажатие -> редактирование: p50 {report['p50'] * 1000:.0f} мс, p95 {report['p95'] * 1000:.0f} мс, "
+          f"p99 {report['p99'] * 1000:.0f} мс (без редактирования: {report['without_edit']})")
+    print(f"Вызовов Bot API на голос: {report['api_calls_per_vote']:.2f} {report['api_calls']}")
+    print(f"Редактирований отправлено: {report['sent_edits']}, пропущено без изменений: {report['skipped_edits']}")
+    if report["limiter_max_wait"] is not None:
+        print(f"Ограничитель: максимальное ожидание {report['limiter_max_wait']:.2f} с, "
+              f"RetryAfter: {report['limiter_retry_afters']}")
+    if report["peak_rss_mb"] is not None:
+        print(f"Пиковый RSS: {report['peak_rss_mb']:.1f} МБ (до нажатий {report['rss_before_mb']:.1f} МБ)")
+    else:
+        print("Пиковый RSS: недоступен на этой платформе")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--chats", type=int, default=20)
+    parser.add_argument("--users", type=int, default=50, help="пользователей в каждом чате")
+    parser.add_argument("--shape", choices=("decay", "uniform", "spike"), default="decay")
+    parser.add_argument("--duration", type=float, default=60, help="длительность всплеска, сек.")
+    parser.add_argument("--changes", type=float, default=0.1, help="доля 'Буду', которые потом передумают")
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка ответа Bot API, сек.")
+    parser.add_argument("--jitter", type=float, default=0.0, help="случайная добавка к задержке, сек.")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="доля ответов 429")
+    parser.add_argument("--server-errors", type=float, default=0.0, help="доля ответов 502")
+    parser.add_argument("--seed", type=int, default=1)
+    return parser.parse_args()
+
+
+async def main() -> None:
+    args = parse_args()
+    api = FakeBotApi(seed=args.seed)
+    await api.start()
+
+    workdir = tempfile.mkdtemp(prefix="loadgen-")
+    # Настройки бота читаются при импорте модуля
+    os.environ.update(BOT_TOKEN=api.token, USERS_DB_PATH=os.path.join(workdir, "users.db"),
+                      POLLS_DB_PATH=os.path.join(workdir, "polls.db"), JOURNAL_DIR=os.path.join(workdir, "journal"))
+    os.environ.pop("WEBHOOK_URL", None)
+    import bot
+
+    application = bot.build_application(base_url=api.base_url)
+    generator = LoadGenerator(api, application, bot, args)
+    api.on_call = generator.on_call
+
+    await application.initialize()
+    await application.post_init(application)
+    await application.start()
+    await application.updater.start_polling(poll_interval=0, timeout=5)
+    try:
+        report = await generator.run()
+    finally:
+        await application.updater.stop()
+        await application.stop()
+        await application.post_stop(application)
+        await application.shutdown()
+        await application.post_shutdown(application)
+        await api.stop()
+    print_report(report, args)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
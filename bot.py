@@ -1,22 +1,53 @@
+import asyncio
+import atexit
+import functools
 import logging
 import os
-from datetime import datetime
+from typing import Optional
 from dotenv import load_dotenv
-from telegram import InlineKeyboardButton, Update, InlineKeyboardMarkup
+from telegram import Update
+from telegram.request import HTTPXRequest
 from telegram.ext import (
     Application,
     CommandHandler,
-    CallbackQueryHandler,
     ContextTypes,
     MessageHandler,
+    TypeHandler,
     filters
 )
 
-# Настройка логирования для Railway
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
+from decoding import LazyUpdatesBot
+from directory import UserDirectory
+from dispatch import CallbackDataRouter, DispatchApplication, context_light
+from edits import EditScheduler
+from keyboards import (
+    START_KEYBOARD,
+    POLL_KEYBOARD_JSON,
+    NEW_POLL_KEYBOARD,
+    results_keyboard,
+    stats_keyboard
 )
+from rendering import format_final_results, format_poll_with_results, format_stats, results_page, stats_page
+from journal import VoteJournal
+from logsetup import parse_rate_limit, parse_sampling, setup_logging
+import metrics
+from metrics import MetricsServer, RENDER_LATENCY, timed_handler
+from processor import ChatShardedUpdateProcessor
+from ratelimit import PRIORITY_NOTICE, RateLimiter
+from storage import MultiStore, PollStorage
+from voting import PollRegistry, VotingSystem
+from webhook import run_webhook
+
+# Настройка логирования для Railway: вывод выполняется в фоновом потоке, чтобы не блокировать цикл событий.
+# LOG_SAMPLING - доля записей логгеров ниже WARNING (httpx пишет строку на каждый запрос к Bot API),
+# LOG_RATE_LIMIT - не больше N записей из одного места кода за период, LOG_FORMAT=json - структурный вывод
+log_listener = setup_logging(
+    level=os.getenv('LOG_LEVEL', 'INFO'),
+    json_output=os.getenv('LOG_FORMAT', 'text') == 'json',
+    sampling=parse_sampling(os.getenv('LOG_SAMPLING', 'httpx=0.01')),
+    rate_limit=parse_rate_limit(os.getenv('LOG_RATE_LIMIT', '20/60'))
+)
+atexit.register(log_listener.stop)
 logger = logging.getLogger(__name__)
 
 # Получение токена из переменных окружения Railway
@@ -26,46 +57,40 @@ if not BOT_TOKEN:
     logger.error("BOT_TOKEN не найден в переменных окружения!")
     raise ValueError("BOT_TOKEN не установлен")
 
-# Эмодзи для кнопок
-EMOJI_YES = "👍"
-EMOJI_NO = "❌"
-EMOJI_RESERVE = "✍️"
-EMOJI_YES_PLUS = "👥"
-EMOJI_CHICKEN = "🐔"
-EMOJI_STATS = "📊"
-EMOJI_SHARE = "🔗"
-EMOJI_RESULTS = "📈"
-EMOJI_FINISH = "🏁"
-
-
-class VotingSystem:
-    def __init__(self):
-        self.active_poll = False
-        self.poll_title = ""
-        self.votes = {
-            "yes": {},  # {user_id: (user_name, guest_count, timestamp)}
-            "no": {},  # {user_id: (user_name, 0, timestamp)}
-            "reserve": {},  # {user_id: (user_name, 0, timestamp)}
-        }
-        self.vote_history = {}  # {user_id: previous_vote}
-        self.chicken_coop_stats = {}  # {user_id: count}
-        self.current_chicken_coop = set()  # user_ids in current chicken coop
-        self.message_id = None
-        self.chat_id = None
-        self.waiting_for_guests = {}  # {user_id: message_id}
-
-    def reset(self):
-        self.active_poll = False
-        self.poll_title = ""
-        self.votes = {"yes": {}, "no": {}, "reserve": {}}
-        self.vote_history = {}
-        self.current_chicken_coop = set()
-        self.message_id = None
-        self.chat_id = None
-        self.waiting_for_guests = {}
-
-
-voting_system = VotingSystem()
+# Окно (в секундах), за которое нажатия объединяются в одно редактирование сообщения
+EDIT_FLUSH_WINDOW = float(os.getenv('EDIT_FLUSH_WINDOW', '1.0'))
+
+# Справочник имен пользователей: файл SQLite и размер LRU-кэша в памяти
+USERS_DB_PATH = os.getenv('USERS_DB_PATH', 'users.db')
+USER_DIRECTORY_SIZE = int(os.getenv('USER_DIRECTORY_SIZE', '10000'))
+
+# Хранилища состояния через запятую: sqlite, journal; восстановление - из первого в списке
+STATE_STORES = [name.strip() for name in os.getenv('STATE_STORES', 'sqlite').split(',') if name.strip()]
+# Файл SQLite с активными голосованиями и статистикой курятника
+POLLS_DB_PATH = os.getenv('POLLS_DB_PATH', 'polls.db')
+# Каталог журнала голосований и частота снимков (в записях)
+JOURNAL_DIR = os.getenv('JOURNAL_DIR', 'journal')
+JOURNAL_SNAPSHOT_EVERY = int(os.getenv('JOURNAL_SNAPSHOT_EVERY', '10000'))
+
+# Режим вебхука: публичный адрес бота (если не задан - long polling), порт Railway и секрет
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')
+PORT = int(os.getenv('PORT', '8443'))
+
+# Сколько обновлений из разных чатов обрабатывается одновременно (внутри чата - по одному)
+MAX_CONCURRENT_UPDATES = int(os.getenv('MAX_CONCURRENT_UPDATES', '64'))
+
+# Порт эндпоинта метрик Prometheus (/metrics); если не задан - метрики не публикуются
+METRICS_PORT = os.getenv('METRICS_PORT')
+METRICS_LISTEN = os.getenv('METRICS_LISTEN', '0.0.0.0')
+
+# Частичный разбор нажатий кнопок: сообщение под кнопкой разбирается только при обращении к его полям
+LAZY_UPDATES = os.getenv('LAZY_UPDATES', '1') != '0'
+
+polls = PollRegistry()
+edit_scheduler = EditScheduler(window=EDIT_FLUSH_WINDOW)
+user_directory = UserDirectory(USERS_DB_PATH, capacity=USER_DIRECTORY_SIZE)
 
 
 def get_user_display_name(user) -> str:
@@ -78,20 +103,50 @@ def get_user_display_name(user) -> str:
         return "Аноним"
 
 
+def get_tapped_poll(update: Update) -> Optional[VotingSystem]:
+    """Голосование, которому принадлежит сообщение с нажатой кнопкой"""
+    message = update.callback_query.message
+    if message is None:
+        return None
+    return polls.get(message.chat.id, message.message_id)
+
+
+def get_shown_poll(update: Update) -> Optional[VotingSystem]:
+    """Голосование для кнопок, которые есть не только под голосованием (меню /start):
+    голосование нажатого сообщения, иначе последнее голосование чата"""
+    poll = get_tapped_poll(update)
+    if poll is None and update.callback_query.message is not None:
+        poll = polls.latest(update.callback_query.message.chat.id)
+    return poll
+
+
+def requested_page(data: str) -> int:
+    """Номер страницы из callback_data вида "show_results:2" (без номера - первая)"""
+    _, _, page = data.partition(":")
+    return int(page) if page else 0
+
+
+def cancel_pending_edit(update: Update) -> None:
+    """Отменить отложенное обновление сообщения, которое сейчас редактируется напрямую"""
+    message = update.callback_query.message
+    if message is not None:
+        edit_scheduler.cancel(message.chat.id, message.message_id)
+
+
+@context_light
+async def remember_user(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Обновление справочника имен по автору каждого обновления"""
+    user = update.effective_user
+    if user is not None:
+        user_directory.update(user.id, get_user_display_name(user))
+
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Команда /start"""
-    keyboard = [
-        [InlineKeyboardButton(f"{EMOJI_YES} Создать голосование", callback_data="create_poll")],
-        [InlineKeyboardButton(f"{EMOJI_RESULTS} Результаты", callback_data="show_results")],
-        [InlineKeyboardButton(f"{EMOJI_STATS} Статистика курятника", callback_data="show_stats")],
-        [InlineKeyboardButton(f"{EMOJI_SHARE} Поделиться", callback_data="share_results")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-
     await update.message.reply_text(
         "Добро пожаловать в систему голосования! 🗳️\n\n"
         "Выберите действие:",
-        reply_markup=reply_markup
+        reply_markup=START_KEYBOARD
     )
 
 
@@ -100,144 +155,55 @@ async def create_poll_start(update: Update, context: ContextTypes.DEFAULT_TYPE)
     query = update.callback_query
     await query.answer()
 
-    if voting_system.active_poll:
-        await query.edit_message_text(
-            "Голосование уже активно! Используйте кнопку 'Результаты' для просмотра."
-        )
-        return
+    # Флаг ставится до подсказки: фильтр обновлений пропускает текст только ожидаемых авторов
+    context.user_data['waiting_for_title'] = True
 
+    # В чате может идти несколько голосований одновременно
     await query.edit_message_text(
         "Введите заголовок для голосования:"
     )
-    context.user_data['waiting_for_title'] = True
 
 
 async def receive_poll_title(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Получение заголовка голосования"""
     if context.user_data.get('waiting_for_title'):
         title = update.message.text
-        voting_system.poll_title = title
-        voting_system.active_poll = True
-        voting_system.chat_id = update.effective_chat.id
+        poll = polls.create(update.effective_chat.id, title)
         context.user_data['waiting_for_title'] = False
 
-        # Создаем сообщение с голосованием
-        message = await send_poll_message(update, context)
-        voting_system.message_id = message.message_id
+        # Создаем сообщение с голосованием; без сообщения голосование недоступно - удаляем его
+        try:
+            message = await send_poll_message(update, context, poll)
+        except Exception:
+            polls.finish(poll)
+            raise
+        polls.attach_message(poll, message.message_id)
 
-        # Оповещаем всех участников с тегом
-        await notify_all_participants(update, context, title)
+        # Оповещаем всех участников с тегом; оповещение ждет лимита группы - не задерживаем обработку чата
+        context.application.create_task(notify_all_participants(update, context, title), update=update)
 
 
-async def send_poll_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def send_poll_message(update: Update, context: ContextTypes.DEFAULT_TYPE, poll: Optional[VotingSystem]):
     """Отправка сообщения с голосованием"""
-    poll_text = format_poll_with_results()
-
-    keyboard = [
-        [
-            InlineKeyboardButton(f"{EMOJI_YES} Буду", callback_data="vote_yes"),
-            InlineKeyboardButton(f"{EMOJI_NO} Не буду", callback_data="vote_no")
-        ],
-        [
-            InlineKeyboardButton(f"{EMOJI_RESERVE} Резерв", callback_data="vote_reserve"),
-            InlineKeyboardButton(f"{EMOJI_YES_PLUS} Буду с гостями", callback_data="add_guests")
-        ],
-        [
-            InlineKeyboardButton(f"{EMOJI_RESULTS} Результаты", callback_data="show_results"),
-            InlineKeyboardButton(f"{EMOJI_STATS} Статистика", callback_data="show_stats")
-        ],
-        [
-            InlineKeyboardButton(f"{EMOJI_SHARE} Поделиться", callback_data="share_results"),
-            InlineKeyboardButton(f"{EMOJI_FINISH} Завершить", callback_data="finish_poll")
-        ]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    poll_text = format_poll_with_results(poll)
 
     if update.callback_query:
-        return await update.callback_query.edit_message_text(
+        message = await update.callback_query.edit_message_text(
             poll_text,
-            reply_markup=reply_markup,
+            reply_markup=POLL_KEYBOARD_JSON,
             parse_mode='HTML'
         )
     else:
-        return await update.message.reply_text(
+        message = await update.message.reply_text(
             poll_text,
-            reply_markup=reply_markup,
+            reply_markup=POLL_KEYBOARD_JSON,
             parse_mode='HTML'
         )
 
-
-def format_poll_with_results() -> str:
-    """Форматирование сообщения голосования с результатами"""
-    if not voting_system.active_poll:
-        return "🗳️ <b>Голосование завершено</b>"
-
-    results = []
-    results.append(f"🗳️ <b>{voting_system.poll_title}</b>\n")
-
-    # Объединенный список "Буду" (с гостями) - сортировка по времени
-    if voting_system.votes["yes"]:
-        results.append(f"\n<b>{EMOJI_YES} Буду:</b>")
-        # Сортируем по timestamp (первые - кто раньше нажал)
-        sorted_yes = sorted(
-            voting_system.votes["yes"].items(),
-            key=lambda x: x[1][2]  # timestamp находится по индексу 2
-        )
-
-        for user_id, (user_name, guest_count, timestamp) in sorted_yes:
-            if guest_count > 0:
-                results.append(f"  • {user_name} (+{guest_count})")
-            else:
-                results.append(f"  • {user_name}")
-    else:
-        results.append(f"\n<b>{EMOJI_YES} Буду:</b> нет участников")
-
-    # Не буду
-    if voting_system.votes["no"]:
-        results.append(f"\n<b>{EMOJI_NO} Не буду:</b>")
-        for user_id, (user_name, count, timestamp) in voting_system.votes["no"].items():
-            results.append(f"  • {user_name}")
-    else:
-        results.append(f"\n<b>{EMOJI_NO} Не буду:</b> нет участников")
-
-    # Резерв
-    if voting_system.votes["reserve"]:
-        results.append(f"\n<b>{EMOJI_RESERVE} Резерв:</b>")
-        for user_id, (user_name, count, timestamp) in voting_system.votes["reserve"].items():
-            results.append(f"  • {user_name}")
-    else:
-        results.append(f"\n<b>{EMOJI_RESERVE} Резерв:</b> нет участников")
-
-    # Курятник
-    if voting_system.current_chicken_coop:
-        results.append(f"\n<b>{EMOJI_CHICKEN} Курятник:</b>")
-        for user_id in voting_system.current_chicken_coop:
-            user_name = "Неизвестный"
-            # Ищем имя пользователя в истории голосований
-            for vote_type in voting_system.votes:
-                if user_id in voting_system.votes[vote_type]:
-                    user_name = voting_system.votes[vote_type][user_id][0]
-                    break
-            results.append(f"  • {user_name}")
-
-    # Статистика - ПРАВИЛЬНЫЙ подсчет
-    total_participants_yes = len(voting_system.votes["yes"])  # количество участников "Буду"
-    total_guests = sum(guest_count for _, guest_count, _ in voting_system.votes["yes"].values())  # сумма гостей
-    total_yes_with_guests = total_participants_yes + total_guests  # участники + гости
-    total_no = len(voting_system.votes["no"])
-    total_reserve = len(voting_system.votes["reserve"])
-    total_participants = total_participants_yes + total_no + total_reserve  # только участники чата
-
-    results.append(f"\n<b>Итого:</b>")
-    if total_guests > 0:
-        results.append(f"✅ Будут: {total_participants_yes} чел. (+{total_guests})")
-    else:
-        results.append(f"✅ Будут: {total_participants_yes} чел.")
-    results.append(f"❌ Не будут: {total_no} чел.")
-    results.append(f"✍️ Резерв: {total_reserve} чел.")
-    results.append(f"📊 Всего участников: {total_yes_with_guests} чел.")
-
-    return "\n".join(results)
+    # Запоминаем отправленное содержимое, чтобы не повторять его при следующих нажатиях
+    edit_scheduler.remember(message.chat_id, message.message_id,
+                            dict(text=poll_text, reply_markup=POLL_KEYBOARD_JSON, parse_mode='HTML'))
+    return message
 
 
 async def notify_all_participants(update: Update, context: ContextTypes.DEFAULT_TYPE, title: str):
@@ -257,7 +223,8 @@ async def notify_all_participants(update: Update, context: ContextTypes.DEFAULT_
         await context.bot.send_message(
             chat_id=update.effective_chat.id,
             text=notification_text,
-            parse_mode='HTML'
+            parse_mode='HTML',
+            rate_limit_args=PRIORITY_NOTICE
         )
 
     except Exception as e:
@@ -272,65 +239,65 @@ async def notify_all_participants(update: Update, context: ContextTypes.DEFAULT_
         await context.bot.send_message(
             chat_id=update.effective_chat.id,
             text=notification_text,
-            parse_mode='HTML'
+            parse_mode='HTML',
+            rate_limit_args=PRIORITY_NOTICE
         )
 
 
+@context_light
 async def handle_vote(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Обработка голосования"""
     query = update.callback_query
+    poll = get_tapped_poll(update)
+    if poll is None:
+        await query.answer("Голосование не найдено или уже завершено")
+        return
     await query.answer()
 
     user = query.from_user
-    user_id = str(user.id)
+    user_id = user.id
     user_name = get_user_display_name(user)
     vote_type = query.data.replace("vote_", "")
-    timestamp = datetime.now()
 
-    previous_vote = voting_system.vote_history.get(user_id)
+    previous_vote = poll.current_vote(user_id)
+    if previous_vote == vote_type:
+        # Повторное нажатие той же кнопки ничего не меняет: ни места в списке, ни гостей, ни записи на диск
+        return
 
     # Проверка перехода из "Буду" в "Не буду" (попадание в курятник)
     if previous_vote == "yes" and vote_type == "no":
-        voting_system.current_chicken_coop.add(user_id)
-        voting_system.chicken_coop_stats[user_id] = voting_system.chicken_coop_stats.get(user_id, 0) + 1
-        await notify_chicken_coop(update, context, user_name)
+        poll.add_to_chicken_coop(user_id)
+        # Оповещение может долго ждать лимита группы - не задерживаем обработку голосов чата
+        context.application.create_task(notify_chicken_coop(update, context, user_name), update=update)
 
-    # Удаляем предыдущий голос
-    for vote_key in voting_system.votes:
-        if user_id in voting_system.votes[vote_key]:
-            del voting_system.votes[vote_key][user_id]
-            break
-
-    # Добавляем новый голос (по умолчанию 0 гостей)
-    voting_system.votes[vote_type][user_id] = (user_name, 0, timestamp)
-    voting_system.vote_history[user_id] = vote_type
+    # Заменяем предыдущий голос новым (по умолчанию 0 гостей)
+    poll.cast_vote(user_id, user_name, vote_type)
 
     # Обновляем сообщение с голосованием и результатами
-    await update_poll_message(update, context)
+    update_poll_message(context, poll)
 
 
+@context_light
 async def add_guests(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Обработка нажатия кнопки 'Буду с гостями'"""
     query = update.callback_query
+    poll = get_tapped_poll(update)
+    if poll is None:
+        await query.answer("Голосование не найдено или уже завершено")
+        return
     await query.answer()
 
     user = query.from_user
-    user_id = str(user.id)
+    user_id = user.id
     user_name = get_user_display_name(user)
-    timestamp = datetime.now()
 
-    # Удаляем предыдущий голос
-    for vote_key in voting_system.votes:
-        if user_id in voting_system.votes[vote_key]:
-            del voting_system.votes[vote_key][user_id]
-            break
-
-    # Добавляем пользователя в "Буду" с 0 гостями (пока)
-    voting_system.votes["yes"][user_id] = (user_name, 0, timestamp)
-    voting_system.vote_history[user_id] = "yes"
+    # Добавляем пользователя в "Буду" с 0 гостями (пока); уже проголосовавший "Буду"
+    # сохраняет место в списке и гостей до ввода нового числа
+    if poll.current_vote(user_id) != "yes":
+        poll.cast_vote(user_id, user_name, "yes")
 
     # Сохраняем ID сообщения для ожидания ввода гостей
-    voting_system.waiting_for_guests[user_id] = query.message.message_id
+    polls.wait_for_guests(user_id, poll, query.message.message_id)
 
     # Запрашиваем количество гостей в ЛИЧНОМ сообщении
     await context.bot.send_message(
@@ -343,15 +310,16 @@ async def add_guests(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
     )
 
     # Возвращаем основное сообщение голосования к исходному состоянию
-    await update_poll_message(update, context)
+    update_poll_message(context, poll)
 
 
 async def handle_guests_input(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Обработка ввода количества гостей"""
-    user_id = str(update.effective_user.id)
+    user_id = update.effective_user.id
 
     # Проверяем, ожидаем ли мы ввод гостей от этого пользователя
-    if user_id not in voting_system.waiting_for_guests:
+    poll = polls.guests_poll(user_id)
+    if poll is None:
         # Игнорируем сообщение, если это не ввод гостей
         return
 
@@ -362,12 +330,10 @@ async def handle_guests_input(update: Update, context: ContextTypes.DEFAULT_TYPE
             return
 
         # Обновляем количество гостей для пользователя
-        if user_id in voting_system.votes["yes"]:
-            user_name, _, timestamp = voting_system.votes["yes"][user_id]
-            voting_system.votes["yes"][user_id] = (user_name, guest_count, timestamp)
+        poll.set_guests(user_id, guest_count)
 
         # Удаляем из ожидания
-        del voting_system.waiting_for_guests[user_id]
+        polls.stop_waiting_for_guests(user_id)
 
         # Подтверждаем ввод гостей в личном сообщении
         await update.message.reply_text(
@@ -378,36 +344,8 @@ async def handle_guests_input(update: Update, context: ContextTypes.DEFAULT_TYPE
         )
 
         # Обновляем основное сообщение голосования
-        if voting_system.message_id and voting_system.chat_id:
-            poll_text = format_poll_with_results()
-
-            keyboard = [
-                [
-                    InlineKeyboardButton(f"{EMOJI_YES} Буду", callback_data="vote_yes"),
-                    InlineKeyboardButton(f"{EMOJI_NO} Не буду", callback_data="vote_no")
-                ],
-                [
-                    InlineKeyboardButton(f"{EMOJI_RESERVE} Резерв", callback_data="vote_reserve"),
-                    InlineKeyboardButton(f"{EMOJI_YES_PLUS} Буду с гостями", callback_data="add_guests")
-                ],
-                [
-                    InlineKeyboardButton(f"{EMOJI_RESULTS} Результаты", callback_data="show_results"),
-                    InlineKeyboardButton(f"{EMOJI_STATS} Статистика", callback_data="show_stats")
-                ],
-                [
-                    InlineKeyboardButton(f"{EMOJI_SHARE} Поделиться", callback_data="share_results"),
-                    InlineKeyboardButton(f"{EMOJI_FINISH} Завершить", callback_data="finish_poll")
-                ]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-
-            await context.bot.edit_message_text(
-                chat_id=voting_system.chat_id,
-                message_id=voting_system.message_id,
-                text=poll_text,
-                reply_markup=reply_markup,
-                parse_mode='HTML'
-            )
+        if poll.message_id and poll.chat_id:
+            update_poll_message(context, poll)
 
     except ValueError:
         await update.message.reply_text("Пожалуйста, введите только цифру (например: 2)")
@@ -423,179 +361,86 @@ async def notify_chicken_coop(update: Update, context: ContextTypes.DEFAULT_TYPE
     await context.bot.send_message(
         chat_id=update.effective_chat.id,
         text=notification_text,
-        parse_mode='HTML'
+        parse_mode='HTML',
+        rate_limit_args=PRIORITY_NOTICE
     )
 
 
-async def update_poll_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Обновление сообщения с голосованием"""
-    poll_text = format_poll_with_results()
-
-    keyboard = [
-        [
-            InlineKeyboardButton(f"{EMOJI_YES} Буду", callback_data="vote_yes"),
-            InlineKeyboardButton(f"{EMOJI_NO} Не буду", callback_data="vote_no")
-        ],
-        [
-            InlineKeyboardButton(f"{EMOJI_RESERVE} Резерв", callback_data="vote_reserve"),
-            InlineKeyboardButton(f"{EMOJI_YES_PLUS} Буду с гостями", callback_data="add_guests")
-        ],
-        [
-            InlineKeyboardButton(f"{EMOJI_RESULTS} Результаты", callback_data="show_results"),
-            InlineKeyboardButton(f"{EMOJI_STATS} Статистика", callback_data="show_stats")
-        ],
-        [
-            InlineKeyboardButton(f"{EMOJI_SHARE} Поделиться", callback_data="share_results"),
-            InlineKeyboardButton(f"{EMOJI_FINISH} Завершить", callback_data="finish_poll")
-        ]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-
-    await update.callback_query.edit_message_text(
-        poll_text,
-        reply_markup=reply_markup,
-        parse_mode='HTML'
-    )
+def update_poll_message(context: ContextTypes.DEFAULT_TYPE, poll: VotingSystem):
+    """Обновление сообщения с голосованием (через планировщик, без ожидания ответа API)"""
+    edit_scheduler.schedule(context.bot, poll.chat_id, poll.message_id, lambda: render_poll_edit(poll))
+
+
+def render_poll_edit(poll: VotingSystem) -> Optional[dict]:
+    """Актуальный текст и клавиатура голосования на момент отправки"""
+    if not poll.active_poll:
+        return None
+
+    with RENDER_LATENCY.labels("poll").time():
+        poll_text = format_poll_with_results(poll)
+
+    # Общая клавиатура в виде готового JSON: без создания кнопок и сериализации на каждое нажатие
+    return dict(text=poll_text, reply_markup=POLL_KEYBOARD_JSON, parse_mode='HTML')
 
 
+@context_light
 async def show_results(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Показать результаты голосования"""
     query = update.callback_query
     await query.answer()
+    cancel_pending_edit(update)
 
-    if not voting_system.active_poll:
+    poll = get_shown_poll(update)
+    if poll is None or not poll.active_poll:
         await query.edit_message_text("Активного голосования нет!")
         return
 
-    results_text = format_results()
-
-    keyboard = [
-        [InlineKeyboardButton("↩️ Назад к голосованию", callback_data="back_to_poll")],
-        [InlineKeyboardButton(f"{EMOJI_SHARE} Поделиться", callback_data="share_results")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    # Форматируется только запрошенная страница
+    with RENDER_LATENCY.labels("results").time():
+        results_text, page, pages = results_page(poll, requested_page(query.data))
 
     await query.edit_message_text(
         results_text,
-        reply_markup=reply_markup,
+        reply_markup=results_keyboard(page, pages),
         parse_mode='HTML'
     )
 
 
-def format_results() -> str:
-    """Форматирование результатов голосования"""
-    results = []
-    results.append(f"📊 <b>Результаты голосования:</b>")
-    results.append(f"<b>{voting_system.poll_title}</b>\n")
-
-    # Объединенный список "Буду" (с гостями) - сортировка по времени
-    if voting_system.votes["yes"]:
-        results.append(f"<b>{EMOJI_YES} Буду:</b>")
-        # Сортируем по timestamp (первые - кто раньше нажал)
-        sorted_yes = sorted(
-            voting_system.votes["yes"].items(),
-            key=lambda x: x[1][2]  # timestamp находится по индексу 2
-        )
-
-        for user_id, (user_name, guest_count, timestamp) in sorted_yes:
-            if guest_count > 0:
-                results.append(f"  • {user_name} (+{guest_count})")
-            else:
-                results.append(f"  • {user_name}")
-    else:
-        results.append(f"<b>{EMOJI_YES} Буду:</b> нет участников")
-
-    # Не буду
-    if voting_system.votes["no"]:
-        results.append(f"\n<b>{EMOJI_NO} Не буду:</b>")
-        for user_id, (user_name, count, timestamp) in voting_system.votes["no"].items():
-            results.append(f"  • {user_name}")
-    else:
-        results.append(f"\n<b>{EMOJI_NO} Не буду:</b> нет участников")
-
-    # Резерв
-    if voting_system.votes["reserve"]:
-        results.append(f"\n<b>{EMOJI_RESERVE} Резерв:</b>")
-        for user_id, (user_name, count, timestamp) in voting_system.votes["reserve"].items():
-            results.append(f"  • {user_name}")
-    else:
-        results.append(f"\n<b>{EMOJI_RESERVE} Резерв:</b> нет участников")
-
-    # Курятник
-    if voting_system.current_chicken_coop:
-        results.append(f"\n<b>{EMOJI_CHICKEN} Курятник:</b>")
-        for user_id in voting_system.current_chicken_coop:
-            user_name = "Неизвестный"
-            # Ищем имя пользователя в истории голосований
-            for vote_type in voting_system.votes:
-                if user_id in voting_system.votes[vote_type]:
-                    user_name = voting_system.votes[vote_type][user_id][0]
-                    break
-            results.append(f"  • {user_name}")
-    else:
-        results.append(f"\n<b>{EMOJI_CHICKEN} Курятник:</b> пусто")
-
-    # Статистика - ПРАВИЛЬНЫЙ подсчет
-    total_participants_yes = len(voting_system.votes["yes"])  # количество участников "Буду"
-    total_guests = sum(guest_count for _, guest_count, _ in voting_system.votes["yes"].values())  # сумма гостей
-    total_yes_with_guests = total_participants_yes + total_guests  # участники + гости
-    total_no = len(voting_system.votes["no"])
-    total_reserve = len(voting_system.votes["reserve"])
-    total_participants = total_participants_yes + total_no + total_reserve  # только участники чата
-
-    results.append(f"\n<b>Итого:</b>")
-    if total_guests > 0:
-        results.append(f"✅ Будут: {total_participants_yes} чел. (+{total_guests})")
-    else:
-        results.append(f"✅ Будут: {total_participants_yes} чел.")
-    results.append(f"❌ Не будут: {total_no} чел.")
-    results.append(f"✍️ Резерв: {total_reserve} чел.")
-    results.append(f"📊 Всего участников: {total_yes_with_guests} чел.")
-
-    return "\n".join(results)
-
-
+@context_light
 async def show_stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Показать статистику курятника"""
     query = update.callback_query
     await query.answer()
+    cancel_pending_edit(update)
 
-    if not voting_system.chicken_coop_stats:
-        stats_text = "📊 <b>Статистика курятника</b>\n\nПока никто не попадал в курятник!"
-    else:
-        stats_text = "📊 <b>Статистика курятника за все время:</b>\n\n"
-        sorted_stats = sorted(voting_system.chicken_coop_stats.items(),
-                              key=lambda x: x[1], reverse=True)
-
-        for user_id, count in sorted_stats:
-            user_name = "Неизвестный"
-            # Ищем актуальное имя пользователя
-            for vote_type in voting_system.votes:
-                if user_id in voting_system.votes[vote_type]:
-                    user_name = voting_system.votes[vote_type][user_id][0]
-                    break
-            stats_text += f"• {user_name}: {count} раз\n"
-
-    keyboard = [[InlineKeyboardButton("↩️ Назад", callback_data="back_to_poll")]]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    chicken_coop_stats = polls.coop_stats(update.effective_chat.id)
+    with RENDER_LATENCY.labels("stats").time():
+        entries, page, pages = stats_page(chicken_coop_stats, requested_page(query.data))
+        # Актуальные имена из справочника одним запросом, только для строк страницы
+        # (имена не из памяти читает поток справочника - цикл событий не ждет диск)
+        names = await user_directory.get_many(user_id for user_id, _ in entries)
+        stats_text = format_stats(entries, names, page, pages)
 
     await query.edit_message_text(
         stats_text,
-        reply_markup=reply_markup,
+        reply_markup=stats_keyboard(page, pages),
         parse_mode='HTML'
     )
 
 
+@context_light
 async def share_results(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Поделиться результатами"""
     query = update.callback_query
     await query.answer()
+    cancel_pending_edit(update)
 
-    if not voting_system.active_poll:
+    poll = get_shown_poll(update)
+    if poll is None or not poll.active_poll:
         await query.edit_message_text("Нет активного голосования!")
         return
 
-    results_text = format_results()
+    results_text = format_final_results(poll)
     share_text = f"🔗 <b>Результаты голосования:</b>\n\n{results_text}"
 
     await query.edit_message_text(
@@ -604,76 +449,232 @@ async def share_results(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     )
 
 
+@context_light
 async def finish_poll(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Завершение голосования"""
     query = update.callback_query
     await query.answer()
+    cancel_pending_edit(update)
 
-    if not voting_system.active_poll:
+    poll = get_tapped_poll(update)
+    if poll is None or not poll.active_poll:
         await query.edit_message_text("Нет активного голосования для завершения!")
         return
 
     # Сохраняем результаты перед сбросом
-    final_results = format_results()
+    final_results = format_final_results(poll)
 
-    # Сбрасываем систему голосования
-    voting_system.reset()
-
-    keyboard = [
-        [InlineKeyboardButton(f"{EMOJI_YES} Создать новое голосование", callback_data="create_poll")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    # Убираем голосование из реестра
+    polls.finish(poll)
 
     await query.edit_message_text(
         f"🏁 <b>Голосование завершено!</b>\n\n{final_results}",
-        reply_markup=reply_markup,
+        reply_markup=NEW_POLL_KEYBOARD,
         parse_mode='HTML'
     )
 
 
+@context_light
 async def back_to_poll(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Вернуться к голосованию"""
     query = update.callback_query
     await query.answer()
-
-    await send_poll_message(update, context)
+    cancel_pending_edit(update)
+
+    poll = get_tapped_poll(update)
+    if poll is None:
+        shown = get_shown_poll(update)
+        if shown is not None:
+            # Голосование открыто из меню /start: сообщение меню показывает его текст, но
+            # остается меню - голоса принимает только сообщение самого голосования
+            await query.edit_message_text(
+                format_poll_with_results(shown),
+                reply_markup=START_KEYBOARD,
+                parse_mode='HTML'
+            )
+            return
+    await send_poll_message(update, context, poll)
 
 
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Обработка текстовых сообщений"""
-    user_id = str(update.effective_user.id)
+    user_id = update.effective_user.id
 
     # Проверяем, ожидаем ли мы ввод заголовка
     if context.user_data.get('waiting_for_title'):
         await receive_poll_title(update, context)
     # Проверяем, ожидаем ли мы ввод количества гостей
-    elif user_id in voting_system.waiting_for_guests:
+    elif polls.guests_poll(user_id) is not None:
         await handle_guests_input(update, context)
     # Игнорируем все остальные сообщения - позволяем участникам общаться свободно
 
 
-def main() -> None:
-    """Запуск бота"""
-    application = Application.builder().token(BOT_TOKEN).build()
-
-    # Обработчики команд
-    application.add_handler(CommandHandler("start", start))
+def wanted_update(application: Application, data: dict) -> bool:
+    """Нужно ли обновление обработчикам - по исходному JSON, до создания объектов PTB.
+
+    Нажатия кнопок нужны всегда. Из сообщений нужны только команды и текст от
+    пользователей, от которых ждем заголовок голосования или количество гостей;
+    остальная переписка в группах, служебные сообщения и медиа отбрасываются.
+    """
+    if "callback_query" in data:
+        return True
+    message = data.get("message") or data.get("edited_message")
+    if message is None:
+        return False
+    text = message.get("text")
+    if text is None:
+        return False
+    if text.startswith("/"):
+        return True
+    user = message.get("from")
+    if user is None:
+        return False
+    user_id = user["id"]
+    if polls.guests_poll(user_id) is not None:
+        return True
+    user_data = application.user_data.get(user_id)
+    return bool(user_data and user_data.get('waiting_for_title'))
+
+
+async def flush_pending_edits(application: Application) -> None:
+    """Отправить отложенные обновления сообщений перед остановкой"""
+    await edit_scheduler.flush_all()
+
+
+def open_state_stores() -> list:
+    """Создать хранилища из STATE_STORES и восстановить реестр из первого"""
+    stores = []
+    for name in STATE_STORES:
+        if name == 'sqlite':
+            stores.append(PollStorage(POLLS_DB_PATH))
+        elif name == 'journal':
+            stores.append(VoteJournal(JOURNAL_DIR, snapshot_every=JOURNAL_SNAPSHOT_EVERY))
+        else:
+            raise ValueError(f"Неизвестное хранилище состояния: {name}")
+
+    if stores:
+        stores[0].load(polls)
+        for store in stores[1:]:
+            # Остальные хранилища переписываются восстановленным состоянием: иначе они
+            # получали бы только изменения к состоянию, которого у них нет
+            store.attach(polls)
+        for store in stores:
+            store.start()
+        polls.set_store(stores[0] if len(stores) == 1 else MultiStore(*stores))
+    return stores
+
+
+async def close_storage(application: Application) -> None:
+    """Дописать на диск голосования и справочник имен"""
+    for store in application.bot_data.get('state_stores', []):
+        store.close()
+    user_directory.close()
+
+
+def register_metrics(application: Application) -> None:
+    """Подключить показатели приложения, планировщика и реестра к метрикам"""
+    limiter = application.bot.rate_limiter
+    metrics.UPDATE_QUEUE_SIZE.set_function(application.update_queue.qsize)
+    metrics.UPDATES_IN_FLIGHT.set_function(lambda: application.update_processor.current_concurrent_updates)
+    metrics.ASYNCIO_TASKS.set_function(lambda: len(asyncio.all_tasks()))
+    metrics.ACTIVE_LANES.set_function(lambda: application.update_processor.active_lanes)
+    metrics.PENDING_EDITS.set_function(edit_scheduler.pending)
+    metrics.SENT_EDITS.set_function(lambda: edit_scheduler.sent_edits)
+    metrics.SKIPPED_EDITS.set_function(lambda: edit_scheduler.skipped_edits)
+    metrics.RATE_LIMIT_QUEUED.set_function(lambda: limiter.queued)
+    metrics.RATE_LIMIT_PAUSED.set_function(lambda: limiter.paused_chats)
+    for priority in limiter.wait_seconds_by_priority:
+        metrics.RATE_LIMIT_WAIT.labels(priority).set_function(
+            lambda priority=priority: limiter.wait_seconds_by_priority[priority])
+    metrics.ACTIVE_POLLS.set_function(lambda: len(polls.all_polls()))
+    metrics.ACTIVE_VOTERS.set_function(lambda: sum(len(poll.voters) for poll in polls.all_polls()))
+    metrics.DROPPED_UPDATES.set_function(lambda: application.bot.dropped_updates)
+
+
+async def start_metrics(application: Application) -> None:
+    """Запустить эндпоинт метрик, если задан METRICS_PORT"""
+    if METRICS_PORT:
+        server = MetricsServer(listen=METRICS_LISTEN, port=int(METRICS_PORT))
+        await server.start()
+        application.bot_data['metrics_server'] = server
+
+
+async def shutdown(application: Application) -> None:
+    """Остановить эндпоинт метрик и закрыть хранилища"""
+    server = application.bot_data.pop('metrics_server', None)
+    if server is not None:
+        await server.stop()
+    await close_storage(application)
+
+
+def build_application(base_url: Optional[str] = None) -> Application:
+    """Собрать приложение со всеми обработчиками (base_url - другой адрес Bot API, например локальная заглушка)"""
+    # Бот создается здесь, а не в билдере, чтобы getUpdates разбирался через decode_update;
+    # размеры пулов соединений - как у билдера по умолчанию
+    bot = LazyUpdatesBot(
+        BOT_TOKEN,
+        base_url=base_url or "https://api.telegram.org/bot",
+        request=HTTPXRequest(connection_pool_size=256),
+        get_updates_request=HTTPXRequest(connection_pool_size=1),
+        rate_limiter=RateLimiter(),
+        lazy_updates=LAZY_UPDATES
+    )
+    builder = (
+        Application.builder()
+        .application_class(DispatchApplication)
+        .bot(bot)
+        .concurrent_updates(ChatShardedUpdateProcessor(MAX_CONCURRENT_UPDATES))
+        .post_init(start_metrics)
+        .post_stop(flush_pending_edits)
+        .post_shutdown(shutdown)
+    )
+    if WEBHOOK_URL:
+        # Обновления принимает собственный вебхук-сервер, Updater не нужен
+        builder = builder.updater(None)
+    application = builder.build()
+    bot.set_update_filter(functools.partial(wanted_update, application))
+    register_metrics(application)
+
+    # Восстанавливаем голосования после перезапуска и включаем фоновую запись
+    application.bot_data['state_stores'] = open_state_stores()
+
+    # Справочник имен обновляется до остальных обработчиков
+    application.add_handler(TypeHandler(Update, timed_handler(remember_user)), group=-1)
+
+    # Обработчики callback-запросов: один маршрутизатор по callback_data вместо проверки каждого шаблона.
+    # Страницы результатов и статистики - "show_results:2" и т.п.
+    results_callback = timed_handler(show_results)
+    stats_callback = timed_handler(show_stats)
+    application.add_handler(
+        CallbackDataRouter()
+        .add("create_poll", timed_handler(create_poll_start))
+        .add("show_results", results_callback)
+        .add_prefix("show_results:", results_callback)
+        .add("show_stats", stats_callback)
+        .add_prefix("show_stats:", stats_callback)
+        .add("share_results", timed_handler(share_results))
+        .add("back_to_poll", timed_handler(back_to_poll))
+        .add("finish_poll", timed_handler(finish_poll))
+        .add("add_guests", timed_handler(add_guests))
+        .add_prefix("vote_", timed_handler(handle_vote))
+    )
 
-    # Обработчики callback-запросов
-    application.add_handler(CallbackQueryHandler(create_poll_start, pattern="^create_poll$"))
-    application.add_handler(CallbackQueryHandler(show_results, pattern="^show_results$"))
-    application.add_handler(CallbackQueryHandler(show_stats, pattern="^show_stats$"))
-    application.add_handler(CallbackQueryHandler(share_results, pattern="^share_results$"))
-    application.add_handler(CallbackQueryHandler(back_to_poll, pattern="^back_to_poll$"))
-    application.add_handler(CallbackQueryHandler(finish_poll, pattern="^finish_poll$"))
-    application.add_handler(CallbackQueryHandler(add_guests, pattern="^add_guests$"))
-    application.add_handler(CallbackQueryHandler(handle_vote, pattern="^vote_"))
+    # Обработчики команд - после callback-запросов: CommandHandler проверяет сущности сообщения
+    # под нажатой кнопкой, и при частичном разборе (LAZY_UPDATES) это разбирало бы их на каждом нажатии
+    application.add_handler(CommandHandler("start", timed_handler(start)))
 
     # Обработчик текстовых сообщений - только для специфических случаев
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, timed_handler(handle_message)))
+    return application
+
 
-    # Запуск бота
-    application.run_polling()
+def main() -> None:
+    """Запуск бота"""
+    application = build_application()
+    if WEBHOOK_URL:
+        run_webhook(application, WEBHOOK_URL, port=PORT, url_path=WEBHOOK_PATH, secret_token=WEBHOOK_SECRET)
+    else:
+        application.run_polling()
 
 
 if __name__ == "__main__":
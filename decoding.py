@@ -0,0 +1,198 @@
+import logging
+from typing import Callable, Optional, Sequence
+
+from telegram import CallbackQuery, Chat, Message, MessageEntity, Update, User
+from telegram.ext import ExtBot
+
+logger = logging.getLogger(__name__)
+
+# Поля callback_query, которые принимает конструктор CallbackQuery (остальное - api_kwargs)
+_CALLBACK_QUERY_FIELDS = {"id", "from", "chat_instance", "data", "message", "inline_message_id", "game_short_name"}
+
+# Слоты, которые не копируются из полностью разобранного сообщения
+_KEEP_SLOTS = {"_raw", "_frozen", "_bot"}
+
+_MESSAGE_SLOTS = {slot for cls in Message.__mro__[:-1] for slot in getattr(cls, "__slots__", ())}
+# Поля, которые Message хранит как есть: копируются из JSON сразу (только те, что есть в этой версии PTB)
+_SCALAR_FIELDS = tuple(field for field in ("text", "caption", "business_connection_id", "message_thread_id",
+                                           "media_group_id", "author_signature") if field in _MESSAGE_SLOTS)
+
+
+class LazyMessage(Message):
+    """Сообщение, разобранное только частично.
+
+    Сразу доступны message_id, chat и простые поля вроде text - этого хватает для
+    поиска голосования, полосы чата и редактирования сообщения. entities
+    разбираются отдельно при первом обращении (их читает CommandHandler для любого
+    обновления с сообщением). Остальные поля (клавиатура, автор, вложения) остаются
+    исходным словарем и разбираются все вместе при первом обращении к любому из
+    них. Объект остается экземпляром Message, поэтому проверки типов и сокращения
+    PTB (edit_text и др.) работают без изменений.
+
+    Класс опирается на внутренности TelegramObject, не входящие в публичный API PTB:
+    _frozen, _freeze() и _unfrozen() (заморозка атрибутов), _id_attrs (сравнение и
+    хэш), _bot и раскладку __slots__ у Message и его предков. Проверено с PTB 21.0
+    (requirements.txt) и 22.5 (bot_env); при обновлении PTB их нужно сверить заново.
+    """
+
+    __slots__ = ("_raw",)
+
+    # Сколько частично разобранных сообщений создано и сколько из них пришлось разобрать полностью
+    created = 0
+    materialized = 0
+
+    @classmethod
+    def from_raw(cls, data: dict, bot) -> "LazyMessage":
+        message = cls.__new__(cls)
+        # Конструктор Message не вызывается: незаданные слоты ведут в __getattr__
+        message._frozen = False
+        message.message_id = data["message_id"]
+        message.chat = Chat.de_json(data["chat"], bot)
+        message._id_attrs = (message.message_id, message.chat)
+        for field in _SCALAR_FIELDS:
+            setattr(message, field, data.get(field))
+        message._raw = data
+        message.set_bot(bot)
+        message._freeze()
+        LazyMessage.created += 1
+        return message
+
+    def __eq__(self, other: object) -> bool:
+        # Как у Message: равно любому Message с теми же message_id и чатом
+        if isinstance(other, Message):
+            return self._id_attrs == other._id_attrs
+        return super().__eq__(other)
+
+    def __hash__(self) -> int:
+        # TelegramObject хэширует (класс, _id_attrs) - берем Message, чтобы хэш совпадал с равным ему Message
+        return hash((Message, self._id_attrs))
+
+    def __getattr__(self, name: str):
+        # Сюда попадают только обращения к незаданным слотам
+        if name == "_raw" or self._raw is None:
+            raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+        if name == "entities":
+            with self._unfrozen():
+                self.entities = MessageEntity.de_list(self._raw.get("entities") or [], self._bot)
+            return self.entities
+        self._materialize()
+        return getattr(self, name)
+
+    def _materialize(self) -> None:
+        full = Message.de_json(self._raw, self._bot)
+        self._raw = None
+        LazyMessage.materialized += 1
+        with self._unfrozen():
+            for cls in type(full).__mro__[:-1]:
+                for slot in getattr(cls, "__slots__", ()):
+                    if slot in _KEEP_SLOTS:
+                        continue
+                    try:
+                        setattr(self, slot, object.__getattribute__(full, slot))
+                    except AttributeError:
+                        pass
+
+
+def decode_update(data: dict, bot) -> Update:
+    """Update из JSON; нажатия кнопок - с частично разобранным сообщением.
+
+    Обработчик голоса читает только автора, callback_data и message_id, поэтому
+    сообщение с текстом голосования, сущностями и клавиатурой не разбирается,
+    пока к нему не обратятся. Остальные обновления разбираются как обычно.
+    """
+    query = data.get("callback_query")
+    message = query.get("message") if query is not None else None
+    # Сообщения с date=0 недоступны боту - их разбирает PTB (InaccessibleMessage)
+    if len(data) != 2 or message is None or not message.get("date"):
+        return Update.de_json(data, bot)
+
+    callback_query = CallbackQuery(
+        id=query["id"],
+        from_user=User.de_json(query["from"], bot),
+        chat_instance=query["chat_instance"],
+        message=LazyMessage.from_raw(message, bot),
+        data=query.get("data"),
+        inline_message_id=query.get("inline_message_id"),
+        game_short_name=query.get("game_short_name"),
+        api_kwargs={key: value for key, value in query.items() if key not in _CALLBACK_QUERY_FIELDS} or None,
+    )
+    callback_query.set_bot(bot)
+    update = Update(update_id=data["update_id"], callback_query=callback_query)
+    update.set_bot(bot)
+    return update
+
+
+# Проверка обновления по исходному JSON: True - обновление нужно обработчикам
+UpdateFilter = Callable[[dict], bool]
+
+
+class LazyUpdatesBot(ExtBot):
+    """ExtBot, разбирающий getUpdates сам: с предварительным фильтром и через decode_update.
+
+    Фильтр (set_update_filter) смотрит на исходный словарь и отбрасывает обновления,
+    которые не нужны ни одному обработчику, до создания объектов PTB. Отброшенные
+    обновления подтверждаются следующим getUpdates, как и обработанные.
+    lazy_updates=False - полный разбор, как в PTB.
+    """
+
+    __slots__ = ("_lazy_updates", "_update_filter", "_decoded", "_next_offset", "_dropped_updates")
+
+    def __init__(self, *args, lazy_updates: bool = True, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._lazy_updates = lazy_updates
+        self._update_filter: Optional[UpdateFilter] = None
+        self._decoded: Optional[Sequence[Update]] = None
+        self._next_offset: Optional[int] = None
+        self._dropped_updates = 0
+
+    @property
+    def lazy_updates(self) -> bool:
+        return self._lazy_updates
+
+    @property
+    def dropped_updates(self) -> int:
+        """Сколько обновлений отброшено фильтром"""
+        return self._dropped_updates
+
+    def set_update_filter(self, update_filter: Optional[UpdateFilter]) -> None:
+        self._update_filter = update_filter
+
+    def accepts(self, data: dict) -> bool:
+        """Пропускает ли фильтр обновление (при ошибке фильтра - пропускает)"""
+        if self._update_filter is None:
+            return True
+        try:
+            accepted = self._update_filter(data)
+        except Exception as e:
+            logger.error(f"Ошибка в фильтре обновлений: {e}")
+            return True
+        if not accepted:
+            self._dropped_updates += 1
+        return accepted
+
+    def decode(self, data: dict) -> Update:
+        return decode_update(data, self) if self._lazy_updates else Update.de_json(data, self)
+
+    async def _post(self, endpoint: str, data: Optional[dict] = None, *args, **kwargs):
+        result = await super()._post(endpoint, data, *args, **kwargs)
+        if endpoint != "getUpdates" or not result or (not self._lazy_updates and self._update_filter is None):
+            return result
+        # Bot.get_updates разбирает результат сам - отдаем ему пустой список,
+        # а обновления, разобранные здесь, возвращает get_updates ниже.
+        # Вызовы getUpdates не пересекаются: Telegram допускает только один
+        self._next_offset = result[-1]["update_id"] + 1
+        self._decoded = tuple(self.decode(update) for update in result if self.accepts(update))
+        return []
+
+    async def get_updates(self, offset: Optional[int] = None, *args, **kwargs):
+        # Updater подтверждает обновления по последнему полученному - если последние
+        # отброшены фильтром, смещение сдвигается здесь, иначе они пришли бы снова
+        if self._next_offset is not None and (offset is None or offset < self._next_offset):
+            offset = self._next_offset
+        updates = await super().get_updates(offset, *args, **kwargs)
+        decoded, self._decoded = self._decoded, None
+        if decoded is None:
+            return updates
+        for update in decoded:
+            self.insert_callback_data(update)
+        return decoded
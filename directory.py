@@ -0,0 +1,157 @@
+import asyncio
+import concurrent.futures
+import logging
+import queue
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Ограничение SQLite на количество параметров в одном запросе
+_SQL_CHUNK = 500
+
+# Служебное сообщение для потока базы
+_STOP = object()
+
+
+class UserDirectory:
+    """Справочник отображаемых имен пользователей.
+
+    В памяти хранится не больше capacity последних использованных имен (LRU),
+    остальные лежат в SQLite. С базой работает только отдельный поток: измененные
+    имена ставятся в очередь и записываются пачками одной транзакцией, чтение
+    имен, которых нет в памяти, тоже идет через эту очередь (после всех
+    поставленных раньше записей). Обработчики не ждут диск: update() только
+    обновляет память, get_many() ожидается как корутина.
+    """
+
+    def __init__(self, path: str = "users.db", capacity: int = 10000):
+        self.path = path
+        self.capacity = capacity
+        self._cache: "OrderedDict[int, str]" = OrderedDict()  # {user_id: display_name}
+        self._queue: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._thread = None
+        self.commits = 0
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def update(self, user_id, name: str) -> bool:
+        """Запомнить имя пользователя; возвращает True, если имя записывается на диск.
+
+        Имя пользователя, которого нет в памяти, с диском не сверяется: оно
+        записывается заново (в фоновом потоке это дешевле, чем чтение на пути обработчика).
+        """
+        user_id = int(user_id)
+        if self._cache.get(user_id) == name:
+            self._cache.move_to_end(user_id)
+            return False
+        self._cache[user_id] = name
+        self._cache.move_to_end(user_id)
+        # Имя уже в очереди на запись, поэтому вытеснение из памяти ничего не теряет
+        while len(self._cache) > self.capacity:
+            self._cache.popitem(last=False)
+        self._submit((user_id, name))
+        return True
+
+    def get(self, user_id) -> Optional[str]:
+        """Имя пользователя из памяти или None"""
+        return self._cache.get(int(user_id))
+
+    async def get_many(self, user_ids: Iterable) -> Dict[int, str]:
+        """Имена для списка пользователей: промахи кэша читаются фоновым потоком пачками"""
+        names = {}
+        missing = []
+        for user_id in map(int, user_ids):
+            name = self._cache.get(user_id)
+            if name is None:
+                missing.append(user_id)
+            else:
+                names[user_id] = name
+        if missing:
+            read = concurrent.futures.Future()
+            self._submit((missing, read))
+            names.update(await asyncio.wrap_future(read))
+        return names
+
+    def flush(self, timeout: float = None) -> bool:
+        """Дождаться записи всех поставленных в очередь имен"""
+        done = threading.Event()
+        self._submit(done)
+        return done.wait(timeout)
+
+    def close(self) -> None:
+        """Записать оставшиеся имена и остановить поток"""
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join()
+            self._thread = None
+
+    def _submit(self, item) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="user-directory", daemon=True)
+            self._thread.start()
+        self._queue.put(item)
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.path)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute("CREATE TABLE IF NOT EXISTS users (user_id INTEGER PRIMARY KEY, name TEXT NOT NULL)")
+        db.commit()
+        return db
+
+    def _run(self) -> None:
+        db = self._connect()
+        stop = False
+        while not stop:
+            batch = [self._queue.get()]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            # Записи до чтения фиксируются раньше него: чтение видит все имена, измененные до запроса
+            names = {}
+            for item in batch:
+                if item is _STOP:
+                    stop = True
+                elif isinstance(item, threading.Event):
+                    self._write(db, names)
+                    item.set()
+                elif isinstance(item[1], concurrent.futures.Future):
+                    self._write(db, names)
+                    user_ids, read = item
+                    try:
+                        read.set_result(self._read(db, user_ids))
+                    except sqlite3.Error as e:
+                        logger.error(f"Ошибка чтения справочника имен: {e}")
+                        read.set_result({})
+                else:
+                    user_id, name = item
+                    names[user_id] = name
+            self._write(db, names)
+        db.close()
+
+    def _write(self, db: sqlite3.Connection, names: Dict[int, str]) -> None:
+        if not names:
+            return
+        try:
+            with db:
+                db.executemany("INSERT OR REPLACE INTO users (user_id, name) VALUES (?, ?)", names.items())
+            self.commits += 1
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка записи справочника имен: {e}")
+        names.clear()
+
+    @staticmethod
+    def _read(db: sqlite3.Connection, user_ids: list) -> Dict[int, str]:
+        names = {}
+        for i in range(0, len(user_ids), _SQL_CHUNK):
+            chunk = user_ids[i:i + _SQL_CHUNK]
+            placeholders = ",".join("?" * len(chunk))
+            names.update(db.execute(f"SELECT user_id, name FROM users WHERE user_id IN ({placeholders})", chunk))
+        return names
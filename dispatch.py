@@ -0,0 +1,214 @@
+import logging
+from typing import Any, Dict, Optional, Tuple
+
+from telegram import Update
+from telegram.ext import Application, ApplicationHandlerStop, BaseHandler, CallbackContext, ExtBot
+# Не публичный API PTB (есть в 21.0 и 22.5): по нему Application.process_update узнает block по умолчанию
+from telegram._utils.defaultvalue import DEFAULT_TRUE
+
+logger = logging.getLogger(__name__)
+
+# Ключ значения в узле префиксного дерева (символы - строки длины 1, None с ними не совпадает)
+_VALUE = None
+
+
+class _PrefixTrie:
+    """Префиксное дерево: самый длинный зарегистрированный префикс строки за O(длины строки)"""
+
+    __slots__ = ("_root", "size")
+
+    def __init__(self):
+        self._root: Dict[Optional[str], Any] = {}
+        self.size = 0
+
+    def add(self, prefix: str, value) -> None:
+        node = self._root
+        for char in prefix:
+            node = node.setdefault(char, {})
+        if _VALUE not in node:
+            self.size += 1
+        node[_VALUE] = value
+
+    def longest(self, key: str):
+        node = self._root
+        found = node.get(_VALUE)
+        for char in key:
+            node = node.get(char)
+            if node is None:
+                break
+            if _VALUE in node:
+                found = node[_VALUE]
+        return found
+
+
+def context_light(callback):
+    """Отметка функции-обработчика, которой не нужны user_data и chat_data.
+
+    Такой обработчик получает общий для всех обновлений контекст без чата и
+    пользователя (context.user_data и context.chat_data - None): для него не
+    создается CallbackContext и не вызывается refresh_data. context.bot,
+    context.application и context.bot_data работают как обычно. Отметку нужно
+    ставить до обертки (timed_handler копирует ее через functools.wraps).
+    """
+    callback.context_light = True
+    return callback
+
+
+class CallbackDataRouter(BaseHandler):
+    """Один обработчик для всех кнопок: callback_data -> функция без перебора и регулярных выражений.
+
+    Сначала ищется точное совпадение callback_data (словарь), затем самый длинный
+    зарегистрированный префикс (префиксное дерево). Время поиска не зависит от
+    числа маршрутов (callback_data не длиннее 64 байт), а Application проверяет
+    один обработчик вместо отдельного CallbackQueryHandler на каждую кнопку.
+    """
+
+    __slots__ = ("_exact", "_prefixes")
+
+    def __init__(self, block: bool = True):
+        super().__init__(self._unrouted, block=block)
+        self._exact: Dict[str, Any] = {}
+        self._prefixes = _PrefixTrie()
+
+    @property
+    def routes(self) -> int:
+        """Количество маршрутов (точных и префиксных)"""
+        return len(self._exact) + self._prefixes.size
+
+    def add(self, data: str, callback) -> "CallbackDataRouter":
+        """Маршрут для callback_data, совпадающей с data целиком"""
+        self._exact[data] = callback
+        return self
+
+    def add_prefix(self, prefix: str, callback) -> "CallbackDataRouter":
+        """Маршрут для callback_data, начинающейся с prefix (например "vote_" или "show_results:")"""
+        self._prefixes.add(prefix, callback)
+        return self
+
+    def route(self, data: str):
+        """Функция для callback_data или None"""
+        callback = self._exact.get(data)
+        if callback is None and self._prefixes.size:
+            callback = self._prefixes.longest(data)
+        return callback
+
+    def check_update(self, update: object):
+        if not isinstance(update, Update) or update.callback_query is None:
+            return None
+        data = update.callback_query.data
+        if not isinstance(data, str):
+            return None
+        return self.route(data)
+
+    async def handle_update(self, update, application, check_result, context):
+        # check_result - функция маршрута, найденная в check_update
+        return await check_result(update, context)
+
+    @staticmethod
+    async def _unrouted(update, context) -> None:
+        """Заглушка для BaseHandler.callback: обновления без маршрута сюда не попадают"""
+
+
+class DispatchApplication(Application):
+    """Application, который не копирует списки обработчиков на каждое обновление.
+
+    Application.process_update перед обработкой копирует список каждой группы, чтобы
+    add_handler/remove_handler во время обработки не ломали перебор. Здесь вместо
+    копий используется неизменяемый снимок (handler_snapshot),
+    который пересобирается только после add_handler/remove_handler; обработка,
+    начатая со старым снимком, его и дорабатывает - как с копиями в PTB.
+    Списки application.handlers нельзя менять напрямую, только через эти методы.
+
+    Обработчики, отмеченные context_light, получают общий контекст: CallbackContext
+    для обновления создается (и обновляется из persistence) только при первом
+    совпадении с обработчиком без отметки.
+    """
+
+    # Application объявляет __slots__ - без своего слота атрибут не добавить
+    __slots__ = ("_handler_snapshot", "_light_context")
+
+    def __init__(self, **kwargs):
+        self._handler_snapshot: Optional[Tuple[Tuple[Tuple[BaseHandler, Optional[bool]], ...], ...]] = None
+        super().__init__(**kwargs)
+        self._light_context: CallbackContext = self.context_types.context(self)
+
+    def add_handler(self, handler: BaseHandler, group: int = 0) -> None:
+        super().add_handler(handler, group)
+        self._handler_snapshot = None
+
+    def remove_handler(self, handler: BaseHandler, group: int = 0) -> None:
+        super().remove_handler(handler, group)
+        self._handler_snapshot = None
+
+    def handler_snapshot(self) -> Tuple[Tuple[Tuple[BaseHandler, Optional[bool]], ...], ...]:
+        """Группы обработчиков по возрастанию номера группы: пары (обработчик, context_light).
+
+        context_light равен None, если он зависит от совпадения (маршруты CallbackDataRouter).
+        """
+        snapshot = self._handler_snapshot
+        if snapshot is None:
+            snapshot = self._handler_snapshot = tuple(
+                tuple((handler, self._context_light(handler)) for handler in handlers)
+                for handlers in self.handlers.values()
+            )
+        return snapshot
+
+    @staticmethod
+    def _context_light(handler: BaseHandler) -> Optional[bool]:
+        if isinstance(handler, CallbackDataRouter):
+            # check_result маршрутизатора - функция маршрута, смотрим на нее при совпадении
+            return None
+        if type(handler).collect_additional_context is not BaseHandler.collect_additional_context:
+            # CommandHandler, CallbackQueryHandler и др. записывают в контекст args/matches
+            return False
+        return getattr(handler.callback, "context_light", False)
+
+    async def process_update(self, update: object) -> None:
+        # Повторяет Application.process_update (PTB 21-22), но перебирает снимок вместо копий
+        # и создает контекст только для обработчиков без context_light
+        self._check_initialized()
+        context = None
+        any_blocking = False
+        for handlers in self.handler_snapshot():
+            try:
+                for handler, light in handlers:
+                    check = handler.check_update(update)
+                    if check is None or check is False:
+                        continue
+                    if light is None:
+                        light = getattr(check, "context_light", False)
+                    if light:
+                        handler_context = self._light_context
+                    else:
+                        if context is None:
+                            try:
+                                context = self.context_types.context.from_update(update, self)
+                            except Exception as exc:
+                                logger.critical(f"Ошибка при создании CallbackContext для {update}, "
+                                                f"обновление не обработано", exc_info=exc)
+                                return
+                            await context.refresh_data()
+                        handler_context = context
+                    coroutine = handler.handle_update(update, self, check, handler_context)
+                    if not handler.block or (
+                        handler.block is DEFAULT_TRUE
+                        and isinstance(self.bot, ExtBot)
+                        and self.bot.defaults
+                        and not self.bot.defaults.block
+                    ):
+                        self.create_task(coroutine, update=update,
+                                         name=f"Application:{self.bot.id}:process_update_non_blocking:{handler}")
+                    else:
+                        any_blocking = True
+                        await coroutine
+                    break  # в каждой группе - не больше одного обработчика
+            except ApplicationHandlerStop:
+                logger.debug("Обработка остановлена через ApplicationHandlerStop")
+                break
+            except Exception as exc:
+                if await self.process_error(update=update, error=exc):
+                    logger.debug("Обработчик ошибок остановил обработку")
+                    break
+        if any_blocking:
+            # Неблокирующие обработчики отмечают обновление для persistence сами по завершении
+            self._mark_for_persistence_update(update=update)
@@ -0,0 +1,121 @@
+import asyncio
+import hashlib
+import logging
+from datetime import timedelta
+from typing import Callable, Dict, Optional, Tuple
+
+from telegram.error import BadRequest, RetryAfter, TelegramError
+
+logger = logging.getLogger(__name__)
+
+# Функция, возвращающая аргументы edit_message_text (или None, если редактировать не нужно)
+RenderCallback = Callable[[], Optional[dict]]
+
+
+def retry_after_seconds(error: RetryAfter) -> float:
+    """Пауза из RetryAfter в секундах (int в PTB 21, timedelta в PTB 22)"""
+    delay = error.retry_after
+    if isinstance(delay, timedelta):
+        return delay.total_seconds()
+    return float(delay)
+
+
+def edit_digest(kwargs: dict) -> bytes:
+    """Хэш текста и клавиатуры сообщения для пропуска редактирований без изменений"""
+    digest = hashlib.blake2b(kwargs.get("text", "").encode(), digest_size=16)
+    reply_markup = kwargs.get("reply_markup")
+    if reply_markup is not None:
+        # Клавиатура может быть передана уже сериализованной в JSON
+        if not isinstance(reply_markup, str):
+            reply_markup = reply_markup.to_json()
+        digest.update(reply_markup.encode())
+    digest.update(str(kwargs.get("parse_mode")).encode())
+    return digest.digest()
+
+
+class EditScheduler:
+    """Планировщик редактирования сообщений голосования.
+
+    На каждое сообщение (chat_id, message_id) хранится только одно ожидающее
+    изменение: при частых нажатиях сообщение перерисовывается не чаще одного раза
+    за окно, и отправляется только самый свежий вариант. Если текст и клавиатура
+    совпадают с последним отправленным вариантом, запрос к API не выполняется.
+    """
+
+    def __init__(self, window: float = 1.0):
+        self.window = window
+        self._pending: Dict[Tuple[int, int], Tuple[object, RenderCallback]] = {}  # {(chat_id, message_id): (bot, render)}
+        self._tasks: Dict[Tuple[int, int], asyncio.Task] = {}
+        self._last_digest: Dict[Tuple[int, int], bytes] = {}  # хэш последнего отправленного содержимого
+        self.sent_edits = 0
+        self.skipped_edits = 0  # редактирования, пропущенные из-за совпадения содержимого
+
+    def schedule(self, bot, chat_id: int, message_id: int, render: RenderCallback) -> None:
+        """Запланировать редактирование; более новый render заменяет ожидающий"""
+        key = (chat_id, message_id)
+        self._pending[key] = (bot, render)
+        if key not in self._tasks:
+            self._tasks[key] = asyncio.create_task(self._flush_later(key))
+
+    def cancel(self, chat_id: int, message_id: int) -> None:
+        """Отменить ожидающее редактирование (сообщение редактируется напрямую)"""
+        self._pending.pop((chat_id, message_id), None)
+        self._last_digest.pop((chat_id, message_id), None)
+
+    def remember(self, chat_id: int, message_id: int, kwargs: dict) -> None:
+        """Запомнить содержимое, отправленное в сообщение напрямую"""
+        self._last_digest[(chat_id, message_id)] = edit_digest(kwargs)
+
+    def pending(self) -> int:
+        return len(self._pending)
+
+    async def flush_all(self) -> None:
+        """Немедленно отправить все ожидающие изменения (при остановке бота)"""
+        for key in list(self._pending):
+            task = self._tasks.pop(key, None)
+            if task is not None:
+                task.cancel()
+            await self._flush(key)
+
+    async def _flush_later(self, key: Tuple[int, int]) -> None:
+        try:
+            while key in self._pending:
+                await asyncio.sleep(self.window)
+                await self._flush(key)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self._tasks.pop(key, None)
+
+    async def _flush(self, key: Tuple[int, int]) -> None:
+        entry = self._pending.pop(key, None)
+        if entry is None:
+            return
+        bot, render = entry
+        kwargs = render()
+        if kwargs is None:
+            return
+
+        digest = edit_digest(kwargs)
+        if self._last_digest.get(key) == digest:
+            self.skipped_edits += 1
+            return
+
+        chat_id, message_id = key
+        try:
+            await bot.edit_message_text(chat_id=chat_id, message_id=message_id, **kwargs)
+            self.sent_edits += 1
+            self._last_digest[key] = digest
+        except RetryAfter as e:
+            # Повторяем после паузы, если за это время не появилось более нового изменения
+            self._pending.setdefault(key, entry)
+            delay = retry_after_seconds(e)
+            logger.warning(f"Flood control для сообщения {key}, повтор через {delay} сек.")
+            await asyncio.sleep(delay)
+        except BadRequest as e:
+            if "message is not modified" in str(e).lower():
+                self._last_digest[key] = digest
+            else:
+                logger.error(f"Ошибка при обновлении сообщения {key}: {e}")
+        except TelegramError as e:
+            logger.error(f"Ошибка при обновлении сообщения {key}: {e}")
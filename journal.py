@@ -0,0 +1,320 @@
+import json
+import logging
+import os
+import queue
+import threading
+from datetime import datetime
+from typing import Iterator, List
+
+logger = logging.getLogger(__name__)
+
+# Коды записей журнала
+POLL_CREATED = "c"
+MESSAGE_ATTACHED = "m"
+VOTE_CAST = "v"
+VOTE_CHANGED = "x"
+VOTE_REMOVED = "r"
+GUESTS_SET = "g"
+COOP_ADDED = "k"
+GUESTS_WAITING = "w"
+GUESTS_DONE = "d"
+POLL_FINISHED = "f"
+
+_STOP = object()
+
+
+class VoteJournal:
+    """Журнал изменений голосований только на дозапись, со снимками состояния.
+
+    Каждое изменение записывается компактной JSON-строкой
+    [lsn, время, код, ...]. Каждые snapshot_every записей в файл сохраняется снимок
+    всего реестра, и запись продолжается в новый сегмент журнала; старые сегменты
+    переносятся в archive/ и остаются полной историей голосов (кто и когда передумал).
+    При запуске загружается последний снимок и воспроизводится только хвост журнала,
+    поэтому время восстановления не растет вместе с историей.
+
+    Запись на диск и fsync выполняет отдельный поток: обработчики только ставят
+    записи в очередь.
+    """
+
+    def __init__(self, directory: str = "journal", snapshot_every: int = 10000):
+        self.directory = directory
+        self.archive_directory = os.path.join(directory, "archive")
+        self.snapshot_every = snapshot_every
+        self.registry = None
+        self._lsn = 0
+        self._since_snapshot = 0
+        self._queue: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._thread = None
+        os.makedirs(self.archive_directory, exist_ok=True)
+
+    # Запись
+
+    def start(self) -> None:
+        """Запустить фоновый поток записи"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="vote-journal", daemon=True)
+            self._thread.start()
+
+    def flush(self, timeout: float = None) -> bool:
+        """Дождаться записи на диск всех поставленных в очередь записей"""
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self) -> None:
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join()
+            self._thread = None
+
+    def _append(self, code: str, *fields) -> None:
+        self._lsn += 1
+        self._queue.put([self._lsn, round(datetime.now().timestamp(), 3), code, *fields])
+        self._since_snapshot += 1
+        if self.registry is not None and self._since_snapshot >= self.snapshot_every:
+            self.snapshot()
+
+    def snapshot(self) -> None:
+        """Снять состояние реестра (в потоке обработчиков) и передать его на запись"""
+        self._since_snapshot = 0
+        state = snapshot_registry(self.registry)
+        state["lsn"] = self._lsn
+        self._queue.put(("snapshot", self._lsn, state))
+
+    def _run(self) -> None:
+        segment = self._open_segment(self._lsn + 1)
+        stop = False
+        while not stop:
+            batch = [self._queue.get()]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            lines = []
+            waiters = []
+            for item in batch:
+                if item is _STOP:
+                    stop = True
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                elif isinstance(item, tuple):
+                    # Все записи до снимка должны попасть в старый сегмент
+                    self._write(segment, lines)
+                    lines = []
+                    _, lsn, state = item
+                    segment = self._compact(segment, lsn, state)
+                else:
+                    lines.append(json.dumps(item, ensure_ascii=False, separators=(",", ":")))
+            self._write(segment, lines)
+            for waiter in waiters:
+                waiter.set()
+        segment.close()
+
+    @staticmethod
+    def _write(segment, lines: List[str]) -> None:
+        if not lines:
+            return
+        segment.write("\n".join(lines) + "\n")
+        segment.flush()
+        os.fsync(segment.fileno())
+
+    def _open_segment(self, first_lsn: int):
+        return open(os.path.join(self.directory, f"journal-{first_lsn:012d}.log"), "a", encoding="utf-8")
+
+    def _compact(self, segment, lsn: int, state: dict):
+        """Записать снимок, начать новый сегмент и убрать в архив все, что снимок покрывает"""
+        path = os.path.join(self.directory, f"snapshot-{lsn:012d}.json")
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+
+        segment.close()
+        new_segment = self._open_segment(lsn + 1)
+        current = os.path.basename(new_segment.name)
+        for name in os.listdir(self.directory):
+            if name.startswith("journal-") and name != current:
+                os.replace(os.path.join(self.directory, name), os.path.join(self.archive_directory, name))
+            elif name.startswith("snapshot-") and name.endswith(".json") and name != os.path.basename(path):
+                os.remove(os.path.join(self.directory, name))
+        return new_segment
+
+    # Изменения состояния (вызываются из VotingSystem и PollRegistry)
+
+    def poll_created(self, poll, next_poll_id: int) -> None:
+        self._append(POLL_CREATED, poll.poll_id, poll.chat_id, poll.poll_title)
+
+    def message_attached(self, poll) -> None:
+        self._append(MESSAGE_ATTACHED, poll.poll_id, poll.message_id)
+
+    def vote_cast(self, poll, user_id: int, previous_vote) -> None:
+        vote = poll.voters[user_id]
+        # Повторный голос за то же (новое место в списке, гости сброшены) - не смена голоса
+        if previous_vote is None or previous_vote == vote.vote_type:
+            self._append(VOTE_CAST, poll.poll_id, user_id, vote.vote_type, vote.user_name, vote.seq)
+        else:
+            self._append(VOTE_CHANGED, poll.poll_id, user_id, vote.vote_type, vote.user_name, vote.seq,
+                         previous_vote)
+
+    def vote_removed(self, poll, user_id: int) -> None:
+        self._append(VOTE_REMOVED, poll.poll_id, user_id)
+
+    def guests_set(self, poll, user_id: int) -> None:
+        self._append(GUESTS_SET, poll.poll_id, user_id, poll.voters[user_id].guest_count)
+
+    def coop_added(self, poll, user_id: int) -> None:
+        self._append(COOP_ADDED, poll.poll_id, user_id)
+
+    def guests_waiting(self, user_id: int, poll, message_id: int) -> None:
+        self._append(GUESTS_WAITING, user_id, poll.poll_id, message_id)
+
+    def guests_done(self, user_id: int) -> None:
+        self._append(GUESTS_DONE, user_id)
+
+    def poll_finished(self, poll) -> None:
+        self._append(POLL_FINISHED, poll.poll_id)
+
+    # Восстановление при запуске
+
+    def load(self, registry) -> None:
+        """Восстановить реестр из последнего снимка и хвоста журнала (реестр без подключенного хранилища)"""
+        self.registry = registry
+        snapshot_lsn = 0
+        snapshots = sorted(name for name in os.listdir(self.directory)
+                           if name.startswith("snapshot-") and name.endswith(".json"))
+        if snapshots:
+            with open(os.path.join(self.directory, snapshots[-1]), encoding="utf-8") as f:
+                state = json.load(f)
+            restore_registry(registry, state)
+            snapshot_lsn = state["lsn"]
+
+        self._lsn = snapshot_lsn
+        replayed = 0
+        for record in iter_records(self.directory):
+            if record[0] <= snapshot_lsn:
+                continue
+            apply_record(registry, record)
+            self._lsn = record[0]
+            replayed += 1
+        self._since_snapshot = replayed
+        logger.info(f"Журнал голосований: снимок до записи {snapshot_lsn}, воспроизведено записей: {replayed}")
+
+    def attach(self, registry) -> None:
+        """Подключить журнал к реестру, восстановленному из другого хранилища.
+
+        Нумерация продолжается с последней записи, а свежий снимок делает
+        журнал согласованным с текущим состоянием реестра.
+        """
+        self.registry = registry
+        for name in os.listdir(self.directory):
+            if name.startswith("snapshot-") and name.endswith(".json"):
+                self._lsn = max(self._lsn, int(name[len("snapshot-"):-len(".json")]))
+        for record in iter_records(self.directory):
+            self._lsn = max(self._lsn, record[0])
+        self.snapshot()
+
+
+def iter_records(directory: str, include_archive: bool = False) -> Iterator[list]:
+    """Записи журнала по порядку; с include_archive - вся история, включая архив"""
+    paths = []
+    if include_archive:
+        archive = os.path.join(directory, "archive")
+        paths += [os.path.join(archive, name) for name in os.listdir(archive) if name.startswith("journal-")]
+    paths += [os.path.join(directory, name) for name in os.listdir(directory) if name.startswith("journal-")]
+    for path in sorted(paths, key=os.path.basename):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # Недописанная строка после аварийной остановки
+                    logger.warning(f"Пропущена поврежденная запись журнала в {path}")
+
+
+def flip_flops(directory: str) -> Iterator[tuple]:
+    """Все смены голоса за всю историю: (время, poll_id, user_id, имя, прежний голос, новый голос)"""
+    for record in iter_records(directory, include_archive=True):
+        if record[2] != VOTE_CHANGED:
+            continue
+        _, timestamp, _, poll_id, user_id, vote_type, user_name, _, previous_vote = record
+        if previous_vote != vote_type:
+            yield datetime.fromtimestamp(timestamp), poll_id, user_id, user_name, previous_vote, vote_type
+
+
+def snapshot_registry(registry) -> dict:
+    """Состояние реестра в виде JSON-совместимого словаря"""
+    polls = []
+    for poll in registry.all_polls():
+        votes = [[vote.user_id, vote.vote_type, vote.user_name, vote.guest_count, vote.seq]
+                 for vote in poll.voters.values()]
+        votes.sort(key=lambda vote: vote[4])
+        polls.append({
+            "poll_id": poll.poll_id,
+            "chat_id": poll.chat_id,
+            "message_id": poll.message_id,
+            "title": poll.poll_title,
+            "votes": votes,
+            "coop": list(poll.current_chicken_coop),
+            "waiting_for_guests": list(poll.waiting_for_guests.items()),
+        })
+    return {
+        "next_poll_id": registry._next_poll_id,
+        # Копии: снимок сериализуется в потоке записи, пока обработчики меняют реестр
+        "coop_stats": [[chat_id, list(stats.items())] for chat_id, stats in registry._coop_stats.items()],
+        "polls": polls,
+    }
+
+
+def restore_registry(registry, state: dict) -> None:
+    """Восстановить реестр из снимка snapshot_registry"""
+    registry._next_poll_id = state["next_poll_id"]
+    for chat_id, stats in state["coop_stats"]:
+        registry.coop_stats(chat_id).update(stats)
+    for data in state["polls"]:
+        poll = registry.restore_poll(data["poll_id"], data["chat_id"], data["message_id"], data["title"])
+        for user_id, vote_type, user_name, guest_count, seq in data["votes"]:
+            poll.restore_vote(user_id, user_name, vote_type, guest_count, seq)
+        poll.current_chicken_coop.update(dict.fromkeys(data["coop"]))
+        for user_id, message_id in data["waiting_for_guests"]:
+            registry.restore_guests_wait(user_id, poll, message_id)
+
+
+def apply_record(registry, record: list) -> None:
+    """Повторить одну запись журнала над реестром"""
+    code = record[2]
+    fields = record[3:]
+    if code == POLL_CREATED:
+        poll_id, chat_id, title = fields
+        registry.restore_poll(poll_id, chat_id, None, title)
+        return
+    if code == GUESTS_DONE:
+        registry.stop_waiting_for_guests(fields[0])
+        return
+    if code == GUESTS_WAITING:
+        user_id, poll_id, message_id = fields
+        poll = registry.get_by_id(poll_id)
+        if poll is not None:
+            registry.wait_for_guests(user_id, poll, message_id)
+        return
+
+    poll = registry.get_by_id(fields[0])
+    if poll is None:
+        return
+    if code == MESSAGE_ATTACHED:
+        registry.attach_message(poll, fields[1])
+    elif code in (VOTE_CAST, VOTE_CHANGED):
+        user_id, vote_type, user_name, seq = fields[1:5]
+        poll.remove_vote(user_id)
+        poll.restore_vote(user_id, user_name, vote_type, 0, seq)
+    elif code == VOTE_REMOVED:
+        poll.remove_vote(fields[1])
+    elif code == GUESTS_SET:
+        poll.set_guests(fields[1], fields[2])
+    elif code == COOP_ADDED:
+        poll.add_to_chicken_coop(fields[1])
+    elif code == POLL_FINISHED:
+        registry.finish(poll)
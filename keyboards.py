@@ -0,0 +1,77 @@
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from rendering import (
+    EMOJI_YES,
+    EMOJI_NO,
+    EMOJI_RESERVE,
+    EMOJI_YES_PLUS,
+    EMOJI_STATS,
+    EMOJI_SHARE,
+    EMOJI_RESULTS,
+    EMOJI_FINISH
+)
+
+# Клавиатуры создаются один раз: объекты telegram неизменяемы и безопасно переиспользуются
+
+START_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton(f"{EMOJI_YES} Создать голосование", callback_data="create_poll")],
+    [InlineKeyboardButton(f"{EMOJI_RESULTS} Результаты", callback_data="show_results")],
+    [InlineKeyboardButton(f"{EMOJI_STATS} Статистика курятника", callback_data="show_stats")],
+    [InlineKeyboardButton(f"{EMOJI_SHARE} Поделиться", callback_data="share_results")]
+])
+
+POLL_KEYBOARD = InlineKeyboardMarkup([
+    [
+        InlineKeyboardButton(f"{EMOJI_YES} Буду", callback_data="vote_yes"),
+        InlineKeyboardButton(f"{EMOJI_NO} Не буду", callback_data="vote_no")
+    ],
+    [
+        InlineKeyboardButton(f"{EMOJI_RESERVE} Резерв", callback_data="vote_reserve"),
+        InlineKeyboardButton(f"{EMOJI_YES_PLUS} Буду с гостями", callback_data="add_guests")
+    ],
+    [
+        InlineKeyboardButton(f"{EMOJI_RESULTS} Результаты", callback_data="show_results"),
+        InlineKeyboardButton(f"{EMOJI_STATS} Статистика", callback_data="show_stats")
+    ],
+    [
+        InlineKeyboardButton(f"{EMOJI_SHARE} Поделиться", callback_data="share_results"),
+        InlineKeyboardButton(f"{EMOJI_FINISH} Завершить", callback_data="finish_poll")
+    ]
+])
+
+RESULTS_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("↩️ Назад к голосованию", callback_data="back_to_poll")],
+    [InlineKeyboardButton(f"{EMOJI_SHARE} Поделиться", callback_data="share_results")]
+])
+
+STATS_KEYBOARD = InlineKeyboardMarkup([[InlineKeyboardButton("↩️ Назад", callback_data="back_to_poll")]])
+
+NEW_POLL_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton(f"{EMOJI_YES} Создать новое голосование", callback_data="create_poll")]
+])
+
+# Готовый JSON клавиатуры голосования: Bot API принимает reply_markup строкой,
+# и PTB передает строковые параметры без повторной сериализации
+POLL_KEYBOARD_JSON = POLL_KEYBOARD.to_json()
+
+
+def page_buttons(callback: str, page: int, pages: int) -> list:
+    """Кнопки "◀ ▶" для перехода между страницами (callback_data вида "show_results:2")"""
+    row = []
+    if page > 0:
+        row.append(InlineKeyboardButton("◀", callback_data=f"{callback}:{page - 1}"))
+    if page < pages - 1:
+        row.append(InlineKeyboardButton("▶", callback_data=f"{callback}:{page + 1}"))
+    return row
+
+
+def results_keyboard(page: int, pages: int) -> InlineKeyboardMarkup:
+    if pages <= 1:
+        return RESULTS_KEYBOARD
+    return InlineKeyboardMarkup([page_buttons("show_results", page, pages), *RESULTS_KEYBOARD.inline_keyboard])
+
+
+def stats_keyboard(page: int, pages: int) -> InlineKeyboardMarkup:
+    if pages <= 1:
+        return STATS_KEYBOARD
+    return InlineKeyboardMarkup([page_buttons("show_stats", page, pages), *STATS_KEYBOARD.inline_keyboard])
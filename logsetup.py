@@ -0,0 +1,148 @@
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+from typing import Dict, Optional, Tuple
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускает только часть записей выбранных логгеров.
+
+    rates: {имя логгера: доля}, доля 0.01 - каждая сотая запись логгера и его
+    потомков. Предупреждения и ошибки проходят всегда.
+    """
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        # Более длинные имена проверяются первыми: "httpx.x" важнее "httpx"
+        self.rates = sorted(rates.items(), key=lambda item: len(item[0]), reverse=True)
+        self._every: Dict[str, int] = {}  # {имя логгера записи: каждая N-я запись}
+        self._seen: Dict[str, int] = {}
+
+    def _period(self, name: str) -> int:
+        every = self._every.get(name)
+        if every is None:
+            every = 1
+            for prefix, rate in self.rates:
+                if name == prefix or name.startswith(prefix + "."):
+                    every = max(1, round(1 / rate)) if rate > 0 else 0
+                    break
+            self._every[name] = every
+        return every
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        every = self._period(record.name)
+        if every == 1:
+            return True
+        if every == 0:
+            return False
+        seen = self._seen.get(record.name, 0)
+        self._seen[record.name] = seen + 1
+        return seen % every == 0
+
+
+class RateLimitFilter(logging.Filter):
+    """Не больше burst записей из одного места кода за period секунд.
+
+    Сообщения формируются f-строками, поэтому повторяющиеся записи узнаются по
+    месту вызова (файл и строка). Число отброшенных записей дописывается к
+    первой записи после окончания периода. Ошибки проходят всегда.
+    """
+
+    def __init__(self, burst: int = 20, period: float = 60.0):
+        super().__init__()
+        self.burst = burst
+        self.period = period
+        self._windows: Dict[Tuple[str, int], list] = {}  # {(файл, строка): [начало периода, записей, отброшено]}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.ERROR:
+            return True
+        key = (record.pathname, record.lineno)
+        now = record.created
+        window = self._windows.get(key)
+        if window is None or now - window[0] >= self.period:
+            dropped = window[2] if window is not None else 0
+            self._windows[key] = [now, 1, 0]
+            if dropped:
+                record.msg = f"{record.getMessage()} (пропущено похожих записей: {dropped})"
+                record.args = None
+            return True
+        if window[1] < self.burst:
+            window[1] += 1
+            return True
+        window[2] += 1
+        return False
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись - один JSON-объект в строке"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "time": self.formatTime(record),
+            "logger": record.name,
+            "level": record.levelname,
+            "message": record.getMessage(),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data["exception"] = record.exc_text
+        return json.dumps(data, ensure_ascii=False)
+
+
+def parse_sampling(value: str) -> Dict[str, float]:
+    """Разбор "httpx=0.01,telegram.ext=0.1" в {имя логгера: доля}"""
+    rates = {}
+    for item in value.split(","):
+        if item.strip():
+            name, _, rate = item.partition("=")
+            rates[name.strip()] = float(rate)
+    return rates
+
+
+def parse_rate_limit(value: str) -> Optional[Tuple[int, float]]:
+    """Разбор "20/60" в (записей, секунд); пустая строка или 0 - без ограничения"""
+    burst, _, period = value.partition("/")
+    if not burst.strip() or int(burst) <= 0:
+        return None
+    return int(burst), float(period or 60)
+
+
+def setup_logging(level: str = "INFO", json_output: bool = False, sampling: Optional[Dict[str, float]] = None,
+                  rate_limit: Optional[Tuple[int, float]] = None) -> logging.handlers.QueueListener:
+    """Логирование через очередь: вывод в stderr выполняет фоновый поток.
+
+    Цикл событий только фильтрует запись и кладет ее в очередь, поэтому не
+    блокируется на записи в поток вывода. Выборка и ограничение частоты применяются
+    до постановки в очередь. Возвращает запущенный QueueListener; перед выходом
+    его нужно остановить, чтобы вывести оставшиеся записи.
+    """
+    output = logging.StreamHandler(sys.stderr)
+    if json_output:
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    records = queue.SimpleQueue()
+    handler = logging.handlers.QueueHandler(records)
+    if sampling:
+        handler.addFilter(SamplingFilter(sampling))
+    if rate_limit:
+        handler.addFilter(RateLimitFilter(*rate_limit))
+
+    root = logging.getLogger()
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
+
+    listener = logging.handlers.QueueListener(records, output)
+    listener.start()
+    return listener
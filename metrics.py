@@ -0,0 +1,310 @@
+import abc
+import asyncio
+import bisect
+import functools
+import logging
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин по умолчанию, сек.: от отрисовки (мкс) до запросов к Bot API (секунды)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", r"\\").replace("\n", r"\n").replace('"', r'\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Registry:
+    """Набор метрик, выводимый в текстовом формате Prometheus"""
+
+    def __init__(self):
+        self._metrics: Dict[str, "_Metric"] = {}
+
+    def register(self, metric: "_Metric") -> None:
+        if metric.name in self._metrics:
+            raise ValueError(f"Метрика {metric.name} уже зарегистрирована")
+        self._metrics[metric.name] = metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            try:
+                lines.extend(metric.samples())
+            except Exception as e:
+                # Ошибка одной функции-источника не должна ломать весь ответ
+                logger.error(f"Ошибка при сборе метрики {metric.name}: {e}")
+        lines.append("")
+        return "\n".join(lines)
+
+
+REGISTRY = Registry()
+
+
+class _Metric(abc.ABC):
+    """Метрика с дочерними значениями по наборам меток (без меток - один набор ())"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = (), registry: Optional[Registry] = REGISTRY):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        if registry is not None:
+            registry.register(self)
+
+    def labels(self, *values):
+        """Дочерняя метрика для набора значений меток (создается при первом обращении)"""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name}: ожидаются метки {self.labelnames}")
+            child = self._children[values] = self._new_child()
+        return child
+
+    @abc.abstractmethod
+    def _new_child(self):
+        """Новое значение для набора меток"""
+
+    @abc.abstractmethod
+    def samples(self) -> List[str]:
+        """Строки значений в текстовом формате Prometheus"""
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+
+class Counter(_Metric):
+    """Монотонный счетчик"""
+
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"
+                for values, child in self._children.items()]
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # последняя корзина - +Inf
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        # Счетчики корзин не накопительные - суммы считаются только при выводе
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    def time(self) -> "_Timer":
+        """Контекстный менеджер, записывающий длительность блока"""
+        return _Timer(self)
+
+
+class _Timer:
+    __slots__ = ("child", "started")
+
+    def __init__(self, child: _HistogramChild):
+        self.child = child
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.child.observe(time.perf_counter() - self.started)
+
+
+class Histogram(_Metric):
+    """Гистограмма длительностей с фиксированными корзинами"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = (),
+                 buckets: Iterable[float] = DEFAULT_BUCKETS, registry: Optional[Registry] = REGISTRY):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def samples(self) -> List[str]:
+        lines = []
+        for values, child in self._children.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, values, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(child.sum)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class _GaugeChild:
+    __slots__ = ("function",)
+
+    def __init__(self):
+        self.function: Optional[Callable[[], float]] = None
+
+    def set_function(self, function: Optional[Callable[[], float]]) -> None:
+        """Функция-источник значения (None - значение не выводится)"""
+        self.function = function
+
+
+class Gauge(_Metric):
+    """Значение, вычисляемое при каждом запросе метрик функцией-источником.
+
+    У каждого набора меток своя функция: gauge.labels("edit").set_function(...);
+    kind="counter" - для счетчиков, которые уже ведутся в других объектах.
+    """
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = (), kind: str = "gauge",
+                 registry: Optional[Registry] = REGISTRY):
+        self.kind = kind
+        super().__init__(name, help, labelnames, registry)
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set_function(self, function: Optional[Callable[[], float]]) -> None:
+        self.labels().set_function(function)
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.function())}"
+                for values, child in self._children.items() if child.function is not None]
+
+
+# Метрики бота
+
+HANDLER_LATENCY = Histogram("bot_handler_duration_seconds", "Время работы обработчика обновления", ["handler"])
+HANDLER_ERRORS = Counter("bot_handler_errors_total", "Исключения в обработчиках", ["handler"])
+RENDER_LATENCY = Histogram("bot_render_duration_seconds", "Время отрисовки текста сообщения", ["view"])
+API_LATENCY = Histogram("bot_api_request_duration_seconds", "Время запроса к Bot API (без ожидания лимита)",
+                        ["method"])
+API_ERRORS = Counter("bot_api_errors_total", "Ошибки запросов к Bot API", ["method", "error"])
+
+UPDATE_QUEUE_SIZE = Gauge("bot_update_queue_size", "Обновлений в Application.update_queue")
+UPDATES_IN_FLIGHT = Gauge("bot_updates_in_flight", "Обновлений в обработке")
+ASYNCIO_TASKS = Gauge("bot_asyncio_tasks", "Задач asyncio в цикле событий")
+ACTIVE_LANES = Gauge("bot_active_chat_lanes", "Чатов с обновлениями в обработке или в ожидании")
+PENDING_EDITS = Gauge("bot_pending_edits", "Отложенных редактирований сообщений голосований")
+SENT_EDITS = Gauge("bot_sent_edits_total", "Отправленных редактирований", kind="counter")
+SKIPPED_EDITS = Gauge("bot_skipped_edits_total", "Редактирований, пропущенных из-за совпадения содержимого",
+                      kind="counter")
+RATE_LIMIT_QUEUED = Gauge("bot_rate_limiter_queued", "Запросов, ожидающих лимита Bot API")
+RATE_LIMIT_PAUSED = Gauge("bot_rate_limiter_paused_chats", "Чатов на паузе после RetryAfter")
+RATE_LIMIT_WAIT = Gauge("bot_rate_limiter_wait_seconds_total", "Суммарное ожидание лимита по классам приоритета",
+                        ["priority"], kind="counter")
+ACTIVE_POLLS = Gauge("bot_active_polls", "Активных голосований")
+ACTIVE_VOTERS = Gauge("bot_active_voters", "Голосующих во всех активных голосованиях")
+DROPPED_UPDATES = Gauge("bot_dropped_updates_total", "Обновлений, отброшенных фильтром до разбора", kind="counter")
+
+
+def timed_handler(callback: Callable, name: Optional[str] = None) -> Callable:
+    """Обертка обработчика PTB: время работы и исключения по имени обработчика"""
+    name = name or callback.__name__
+    latency = HANDLER_LATENCY.labels(name)
+    errors = HANDLER_ERRORS.labels(name)
+
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        started = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except Exception:
+            errors.inc()
+            raise
+        finally:
+            latency.observe(time.perf_counter() - started)
+
+    return wrapper
+
+
+class MetricsServer:
+    """HTTP-эндпоинт метрик на asyncio streams: GET /metrics в формате Prometheus"""
+
+    def __init__(self, registry: Registry = REGISTRY, listen: str = "0.0.0.0", port: int = 9100,
+                 path: str = "/metrics"):
+        self.registry = registry
+        self.listen = listen
+        self.port = port
+        self.path = "/" + path.lstrip("/")
+        self._server = None
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle_connection, self.listen, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"Метрики доступны на {self.listen}:{self.port}{self.path}")
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request_line = await reader.readline()
+            while True:
+                # Заголовки и тело запроса не нужны
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+            parts = request_line.split()
+            body = b""
+            if len(parts) != 3:
+                status = "400 Bad Request"
+            elif parts[1].split(b"?", 1)[0].decode("latin-1") != self.path:
+                status = "404 Not Found"
+            elif parts[0] not in (b"GET", b"HEAD"):
+                status = "405 Method Not Allowed"
+            else:
+                status, body = "200 OK", self.registry.render().encode()
+            length = len(body)
+            if parts and parts[0] == b"HEAD":
+                body = b""
+            writer.write(f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                         f"Content-Length: {length}\r\nConnection: close\r\n\r\n".encode("ascii") + body)
+            await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
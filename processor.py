@@ -0,0 +1,78 @@
+import asyncio
+from typing import Awaitable, Dict, Hashable, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+
+class _Lane:
+    """Очередь обновлений одного чата: замок и число ожидающих его обновлений"""
+
+    __slots__ = ("lock", "pending")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.pending = 0
+
+
+class ChatShardedUpdateProcessor(BaseUpdateProcessor):
+    """Обработка обновлений последовательно внутри чата и параллельно между чатами.
+
+    Каждое обновление попадает в полосу своего чата (для обновлений без чата - в
+    полосу пользователя). Внутри полосы обновления обрабатываются строго по одному
+    в порядке поступления, поэтому порядок голосов в чате сохраняется. Разные
+    полосы работают параллельно, но одновременно обрабатывается не больше
+    max_concurrent_updates обновлений. Полоса создается при первом обновлении и
+    удаляется, как только в ней не остается ожидающих обновлений.
+    """
+
+    def __init__(self, max_concurrent_updates: int = 64):
+        super().__init__(max_concurrent_updates)
+        self._lanes: Dict[Hashable, _Lane] = {}
+
+    @property
+    def active_lanes(self) -> int:
+        """Количество чатов, в которых сейчас есть обновления в обработке или в ожидании"""
+        return len(self._lanes)
+
+    @staticmethod
+    def lane_key(update: object) -> Optional[Hashable]:
+        """Ключ полосы: чат, иначе пользователь; None - обновление вне полос"""
+        if not isinstance(update, Update):
+            return None
+        if update.effective_chat is not None:
+            return update.effective_chat.id
+        if update.effective_user is not None:
+            return "user", update.effective_user.id
+        return None
+
+    async def process_update(self, update: object, coroutine: Awaitable) -> None:
+        key = self.lane_key(update)
+        if key is None:
+            await super().process_update(update, coroutine)
+            return
+
+        lane = self._lanes.get(key)
+        if lane is None:
+            lane = self._lanes[key] = _Lane()
+        lane.pending += 1
+        try:
+            # Место в общем лимите занимается только после очереди своего чата,
+            # чтобы один загруженный чат не держал все места, ожидая сам себя.
+            # asyncio.Lock пропускает ожидающих по порядку, а задачи на обновления
+            # создаются в порядке поступления - порядок внутри чата сохраняется
+            async with lane.lock:
+                await super().process_update(update, coroutine)
+        finally:
+            lane.pending -= 1
+            if lane.pending == 0:
+                del self._lanes[key]
+
+    async def do_process_update(self, update: object, coroutine: Awaitable) -> None:
+        await coroutine
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
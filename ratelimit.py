@@ -0,0 +1,285 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from typing import Any, Callable, Coroutine, Dict, List, Optional, Tuple, Union
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from edits import retry_after_seconds
+from metrics import API_ERRORS, API_LATENCY
+
+logger = logging.getLogger(__name__)
+
+# Классы приоритета запросов (передаются через rate_limit_args)
+PRIORITY_EDIT = "edit"  # редактирование сообщений голосования
+PRIORITY_MESSAGE = "message"  # ответы пользователям
+PRIORITY_NOTICE = "notice"  # оповещения (курятник, новое голосование)
+
+# Порядок внутри очереди чата и вес в справедливой очереди между чатами
+_RANK = {PRIORITY_EDIT: 0, PRIORITY_MESSAGE: 1, PRIORITY_NOTICE: 2}
+_WEIGHT = {PRIORITY_EDIT: 4.0, PRIORITY_MESSAGE: 2.0, PRIORITY_NOTICE: 1.0}
+
+# Сколько очередей чатов держать, прежде чем удалять простаивающие
+_MAX_IDLE_QUEUES = 512
+
+
+class TokenBucket:
+    """Корзина токенов: max_rate запросов за period секунд, пополняется непрерывно"""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, max_rate: float, period: float, now: float):
+        self.rate = max_rate / period
+        self.capacity = max_rate
+        self.tokens = max_rate
+        self.updated = now
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        """Через сколько секунд появится токен (0 - уже есть)"""
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self, now: float) -> None:
+        self._refill(now)
+        self.tokens -= 1
+
+    def full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class _ChatQueue:
+    """Ожидающие запросы одного чата: куча (ранг приоритета, порядковый номер, future, время постановки)"""
+
+    __slots__ = ("key", "bucket", "heap", "finish", "paused_until", "scheduled")
+
+    def __init__(self, key, bucket: Optional[TokenBucket]):
+        self.key = key
+        self.bucket = bucket  # только для групп
+        self.heap: List[Tuple[int, int, asyncio.Future, float, str]] = []
+        self.finish = 0.0  # виртуальное время окончания последнего запроса чата
+        self.paused_until = 0.0  # пауза после RetryAfter
+        self.scheduled = False  # чат уже в очереди диспетчера или ждет таймера
+
+
+class RateLimiter(BaseRateLimiter):
+    """Ограничение частоты запросов к Bot API на asyncio, без aiolimiter.
+
+    Запросы с chat_id проходят через общую корзину (около 30 в секунду), запросы
+    в группы - еще и через корзину группы (20 в минуту). Между чатами запросы
+    распределяются справедливой очередью с весами (WFQ): загруженная группа не
+    задерживает остальные, а редактирования голосований получают больший вес,
+    чем оповещения. Внутри чата редактирования обгоняют ожидающие оповещения,
+    запросы одного класса идут по порядку. RetryAfter приостанавливает только
+    чат, в котором он получен. Запросы без chat_id (getUpdates, answerCallbackQuery)
+    не ограничиваются.
+
+    rate_limit_args - класс приоритета (PRIORITY_*); по умолчанию редактирования
+    получают PRIORITY_EDIT, остальные запросы - PRIORITY_MESSAGE.
+    """
+
+    def __init__(self, overall_max_rate: float = 30, overall_time_period: float = 1,
+                 group_max_rate: float = 20, group_time_period: float = 60, max_retries: int = 0):
+        self.overall_max_rate = overall_max_rate
+        self.overall_time_period = overall_time_period
+        self.group_max_rate = group_max_rate
+        self.group_time_period = group_time_period
+        self.max_retries = max_retries
+        self._overall: Optional[TokenBucket] = None
+        self._queues: Dict[Union[int, str], _ChatQueue] = {}
+        self._ready: List[Tuple[float, int, _ChatQueue]] = []  # чаты, готовые к отправке, по виртуальному времени
+        self._virtual_time = 0.0
+        self._counter = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        # Метрики
+        self.queued = 0  # запросов в очереди сейчас
+        self.granted = 0
+        self.wait_seconds_total = 0.0
+        self.max_wait = 0.0
+        self.retry_afters = 0
+        self.granted_by_priority = dict.fromkeys(_RANK, 0)
+        self.wait_seconds_by_priority = dict.fromkeys(_RANK, 0.0)
+
+    @property
+    def paused_chats(self) -> int:
+        """Количество чатов, приостановленных после RetryAfter"""
+        now = asyncio.get_running_loop().time()
+        return sum(1 for queue in self._queues.values() if queue.paused_until > now)
+
+    async def initialize(self) -> None:
+        self._start()
+
+    async def shutdown(self) -> None:
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            self._dispatcher = None
+
+    def _start(self) -> None:
+        if self._dispatcher is None:
+            self._overall = TokenBucket(self.overall_max_rate, self.overall_time_period,
+                                        asyncio.get_running_loop().time())
+            self._wakeup = asyncio.Event()
+            self._dispatcher = asyncio.create_task(self._dispatch())
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, Union[bool, dict, List[dict]]]],
+        args: Any,
+        kwargs: Dict[str, Any],
+        endpoint: str,
+        data: Dict[str, Any],
+        rate_limit_args: Optional[str],
+    ) -> Union[bool, dict, List[dict]]:
+        chat_id = data.get("chat_id")
+        if chat_id is None:
+            return await self._send(callback, args, kwargs, endpoint)
+
+        if rate_limit_args in _RANK:
+            priority = rate_limit_args
+        elif endpoint.startswith("edit"):
+            priority = PRIORITY_EDIT
+        else:
+            priority = PRIORITY_MESSAGE
+
+        try:
+            chat_id = int(chat_id)
+        except (TypeError, ValueError):
+            pass
+        # Отрицательные id и @username - группы и каналы
+        is_group = isinstance(chat_id, str) or chat_id < 0
+
+        self._start()
+        for attempt in range(self.max_retries + 1):
+            await self._acquire(chat_id, is_group, priority)
+            try:
+                return await self._send(callback, args, kwargs, endpoint)
+            except RetryAfter as e:
+                delay = retry_after_seconds(e)
+                self.retry_afters += 1
+                self._pause(chat_id, delay)
+                logger.warning(f"Flood control в чате {chat_id}, пауза {delay} сек.")
+                if attempt == self.max_retries:
+                    raise
+
+    @staticmethod
+    async def _send(callback, args, kwargs, endpoint: str):
+        """Запрос к Bot API с записью времени ответа и ошибок по методу"""
+        started = time.perf_counter()
+        try:
+            return await callback(*args, **kwargs)
+        except Exception as e:
+            API_ERRORS.labels(endpoint, type(e).__name__).inc()
+            raise
+        finally:
+            API_LATENCY.labels(endpoint).observe(time.perf_counter() - started)
+
+    def _queue(self, chat_id, is_group: bool) -> _ChatQueue:
+        queue = self._queues.get(chat_id)
+        if queue is None:
+            if len(self._queues) >= _MAX_IDLE_QUEUES:
+                self._reap()
+            now = asyncio.get_running_loop().time()
+            bucket = None
+            if is_group and self.group_max_rate:
+                bucket = TokenBucket(self.group_max_rate, self.group_time_period, now)
+            queue = self._queues[chat_id] = _ChatQueue(chat_id, bucket)
+        return queue
+
+    def _reap(self) -> None:
+        """Удалить очереди чатов без ожидающих запросов, с полной корзиной и без паузы"""
+        now = asyncio.get_running_loop().time()
+        for key, queue in list(self._queues.items()):
+            if (not queue.heap and not queue.scheduled and queue.paused_until <= now
+                    and (queue.bucket is None or queue.bucket.full(now))):
+                del self._queues[key]
+
+    async def _acquire(self, chat_id, is_group: bool, priority: str) -> None:
+        queue = self._queue(chat_id, is_group)
+        future = asyncio.get_running_loop().create_future()
+        enqueued = asyncio.get_running_loop().time()
+        heapq.heappush(queue.heap, (_RANK[priority], next(self._counter), future, enqueued, priority))
+        self.queued += 1
+        self._schedule(queue)
+        await future
+
+    def _pause(self, chat_id, delay: float) -> None:
+        queue = self._queues.get(chat_id)
+        if queue is not None:
+            now = asyncio.get_running_loop().time()
+            queue.paused_until = max(queue.paused_until, now + delay)
+
+    def _schedule(self, queue: _ChatQueue) -> None:
+        """Поставить чат в очередь диспетчера или отложить до паузы/пополнения корзины"""
+        if queue.scheduled or not queue.heap:
+            return
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        ready_at = queue.paused_until
+        if queue.bucket is not None:
+            ready_at = max(ready_at, now + queue.bucket.delay(now))
+        queue.scheduled = True
+        if ready_at > now:
+            loop.call_at(ready_at, self._reschedule, queue)
+            return
+        # Виртуальное время окончания: чем больше вес класса, тем раньше очередь чата
+        priority = queue.heap[0][4]
+        tag = max(self._virtual_time, queue.finish) + 1 / _WEIGHT[priority]
+        heapq.heappush(self._ready, (tag, next(self._counter), queue))
+        self._wakeup.set()
+
+    def _reschedule(self, queue: _ChatQueue) -> None:
+        queue.scheduled = False
+        self._schedule(queue)
+
+    async def _dispatch(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            if not self._ready:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            delay = self._overall.delay(loop.time())
+            if delay:
+                await asyncio.sleep(delay)
+                continue
+
+            tag, _, queue = heapq.heappop(self._ready)
+            queue.scheduled = False
+            # Запросы, чьи обработчики уже отменены, пропускаются
+            while queue.heap and queue.heap[0][2].done():
+                heapq.heappop(queue.heap)
+                self.queued -= 1
+            if not queue.heap:
+                continue
+
+            now = loop.time()
+            if queue.paused_until > now or (queue.bucket is not None and queue.bucket.delay(now)):
+                # Чат попал на паузу, пока ждал своей очереди
+                self._schedule(queue)
+                continue
+
+            _, _, future, enqueued, priority = heapq.heappop(queue.heap)
+            self.queued -= 1
+            self._virtual_time = queue.finish = tag
+            self._overall.take(now)
+            if queue.bucket is not None:
+                queue.bucket.take(now)
+
+            waited = now - enqueued
+            self.granted += 1
+            self.granted_by_priority[priority] += 1
+            self.wait_seconds_total += waited
+            self.wait_seconds_by_priority[priority] += waited
+            self.max_wait = max(self.max_wait, waited)
+            future.set_result(None)
+            self._schedule(queue)
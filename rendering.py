@@ -0,0 +1,270 @@
+import heapq
+import itertools
+from typing import List, Optional, Tuple
+
+# Эмодзи для кнопок
+EMOJI_YES = "👍"
+EMOJI_NO = "❌"
+EMOJI_RESERVE = "✍️"
+EMOJI_YES_PLUS = "👥"
+EMOJI_CHICKEN = "🐔"
+EMOJI_STATS = "📊"
+EMOJI_SHARE = "🔗"
+EMOJI_RESULTS = "📈"
+EMOJI_FINISH = "🏁"
+
+SECTIONS = ("yes", "no", "reserve", "coop", "totals")
+
+# Ограничение Telegram на длину текста сообщения
+MESSAGE_LIMIT = 4096
+# Строк участников на странице результатов и статистики (имя в Telegram - до 129 символов)
+PAGE_SIZE = 25
+# Запас под заголовок, который бот добавляет к результатам при завершении и в «Поделиться»
+_HEADER_RESERVE = 64
+# Больше строк участников (самая короткая - "  • x") в одно сообщение заведомо не поместится
+_SINGLE_ENTRIES_LIMIT = MESSAGE_LIMIT // len("  • x\n")
+
+# Секции со списками участников и их заголовки
+_LIST_SECTIONS = (
+    ("yes", f"{EMOJI_YES} Буду"),
+    ("no", f"{EMOJI_NO} Не буду"),
+    ("reserve", f"{EMOJI_RESERVE} Резерв"),
+    ("coop", f"{EMOJI_CHICKEN} Курятник"),
+)
+
+
+def page_count(entries: int) -> int:
+    """Количество страниц для списка из entries строк (минимум одна)"""
+    return max(1, -(-entries // PAGE_SIZE))
+
+
+def _clamp_page(page: int, pages: int) -> int:
+    return max(0, min(page, pages - 1))
+
+
+class PollRenderer:
+    """Инкрементальная отрисовка голосования.
+
+    Фрагменты секций ("Буду", "Не буду", "Резерв", "Курятник", "Итого") кэшируются
+    и пересобираются только после изменения соответствующей секции. Для больших
+    голосований сообщение содержит только итоги, а результаты разбиваются на
+    страницы, только если не помещаются в одно сообщение: тогда форматируются
+    лишь строки запрошенной страницы.
+    """
+
+    def __init__(self, poll):
+        self.poll = poll
+        self._fragments = {}
+        self._dirty = set(SECTIONS)
+        self._poll_text = None
+        self._results_pages = {}  # {номер страницы: текст}
+        self._pages = None
+
+    def invalidate(self, *sections):
+        """Пометить секции как измененные (без аргументов - все секции)"""
+        self._dirty.update(sections or SECTIONS)
+        self._poll_text = None
+        self._results_pages.clear()
+        self._pages = None
+
+    def fragment(self, section: str) -> str:
+        """Тело секции; пересобирается, только если секция изменилась"""
+        if section in self._dirty:
+            self._fragments[section] = self._render_totals() if section == "totals" else self._lines(section)
+            self._dirty.discard(section)
+        return self._fragments[section]
+
+    def count(self, section: str) -> int:
+        if section == "coop":
+            return len(self.poll.current_chicken_coop)
+        return len(self.poll.votes[section])
+
+    def poll_text(self) -> str:
+        """Текст сообщения голосования"""
+        if self._poll_text is None:
+            # Списки целиком, если помещаются в сообщение, иначе только итоги
+            text = None
+            if sum(self.count(section) for section, _ in _LIST_SECTIONS) <= _SINGLE_ENTRIES_LIMIT:
+                text = self._full_poll_text()
+            if text is None or len(text) > MESSAGE_LIMIT:
+                text = self._summary_text()
+            self._poll_text = text
+        return self._poll_text
+
+    def _full_poll_text(self) -> str:
+        results = [f"🗳️ <b>{self.poll.poll_title}</b>\n"]
+        results.append(_section(f"\n<b>{EMOJI_YES} Буду:</b>", self.fragment("yes")))
+        results.append(_section(f"\n<b>{EMOJI_NO} Не буду:</b>", self.fragment("no")))
+        results.append(_section(f"\n<b>{EMOJI_RESERVE} Резерв:</b>", self.fragment("reserve")))
+        coop = self.fragment("coop")
+        if coop:
+            results.append(f"\n<b>{EMOJI_CHICKEN} Курятник:</b>\n{coop}")
+        results.append(self.fragment("totals"))
+        return "\n".join(results)
+
+    def _summary_text(self) -> str:
+        # Размер не зависит от числа участников
+        return "\n".join([
+            f"🗳️ <b>{self.poll.poll_title}</b>\n",
+            f"Участников много - списки по страницам в «{EMOJI_RESULTS} Результаты».",
+            self.fragment("totals"),
+        ])
+
+    def page_count(self) -> int:
+        """Количество страниц результатов: одна, если все результаты помещаются в сообщение"""
+        if self._pages is None:
+            entries = sum(self.count(section) for section, _ in _LIST_SECTIONS)
+            if entries <= _SINGLE_ENTRIES_LIMIT:
+                text = self._results_single()
+                if len(text) <= MESSAGE_LIMIT - _HEADER_RESERVE:
+                    self._results_pages[0] = text
+                    self._pages = 1
+                    return 1
+            self._pages = page_count(entries)
+        return self._pages
+
+    def results_page(self, page: int = 0) -> str:
+        """Текст страницы результатов (номер страницы должен быть в пределах page_count())"""
+        text = self._results_pages.get(page)
+        if text is None:
+            pages = self.page_count()
+            # page_count() мог уже положить в кэш полный текст
+            text = self._results_pages.get(page)
+            if text is None:
+                text = self._results_paged(page, pages)
+                self._results_pages[page] = text
+        return text
+
+    def final_text(self) -> str:
+        """Результаты одним сообщением (итог и «Поделиться»): полностью или только итоги"""
+        if self.page_count() == 1:
+            return self.results_page(0)
+        return "\n".join([
+            f"📊 <b>Результаты голосования:</b>",
+            f"<b>{self.poll.poll_title}</b>\n",
+            "Участников слишком много для одного сообщения - показаны только итоги.",
+            self.fragment("totals"),
+        ])
+
+    def _results_single(self) -> str:
+        results = [f"📊 <b>Результаты голосования:</b>", f"<b>{self.poll.poll_title}</b>\n"]
+        results.append(_section(f"<b>{EMOJI_YES} Буду:</b>", self.fragment("yes")))
+        results.append(_section(f"\n<b>{EMOJI_NO} Не буду:</b>", self.fragment("no")))
+        results.append(_section(f"\n<b>{EMOJI_RESERVE} Резерв:</b>", self.fragment("reserve")))
+        results.append(_section(f"\n<b>{EMOJI_CHICKEN} Курятник:</b>", self.fragment("coop"), "пусто"))
+        results.append(self.fragment("totals"))
+        return "\n".join(results)
+
+    def _results_paged(self, page: int, pages: int) -> str:
+        results = [f"📊 <b>Результаты голосования:</b>", f"<b>{self.poll.poll_title}</b>\n"]
+        start, stop = page * PAGE_SIZE, (page + 1) * PAGE_SIZE
+        offset = 0
+        for section, title in _LIST_SECTIONS:
+            count = self.count(section)
+            # Пересечение страницы с секцией - форматируются только эти строки
+            lo, hi = max(start - offset, 0), min(stop - offset, count)
+            if lo < hi:
+                prefix = "\n" if len(results) > 2 else ""
+                results.append(f"{prefix}<b>{title} ({count}):</b>\n{self._lines(section, lo, hi)}")
+            offset += count
+        if pages > 1:
+            results.append(f"\nСтраница {page + 1} из {pages}")
+        results.append(self.fragment("totals"))
+        return "\n".join(results)
+
+    def _entries(self, section: str):
+        """Участники секции в порядке отображения: (имя, гости)"""
+        if section == "coop":
+            for user_id in self.poll.current_chicken_coop:
+                # Имя берется из индекса текущих голосов за O(1)
+                yield self.poll.display_name(user_id) or "Неизвестный", 0
+        else:
+            # Корзины хранят голоса в порядке нажатия (первые - кто раньше нажал)
+            for vote in self.poll.votes[section].values():
+                yield vote.user_name, vote.guest_count
+
+    def _lines(self, section: str, start: int = 0, stop: Optional[int] = None) -> str:
+        lines = []
+        for user_name, guest_count in itertools.islice(self._entries(section), start, stop):
+            if guest_count > 0:
+                lines.append(f"  • {user_name} (+{guest_count})")
+            else:
+                lines.append(f"  • {user_name}")
+        return "\n".join(lines)
+
+    def _render_totals(self) -> str:
+        # Счетчики поддерживаются VotingSystem за O(1), здесь только форматирование
+        total_participants_yes = len(self.poll.votes["yes"])  # количество участников "Буду"
+        total_guests = self.poll.total_guests  # сумма гостей
+        total_yes_with_guests = total_participants_yes + total_guests  # участники + гости
+        total_no = len(self.poll.votes["no"])
+        total_reserve = len(self.poll.votes["reserve"])
+
+        results = [f"\n<b>Итого:</b>"]
+        if total_guests > 0:
+            results.append(f"✅ Будут: {total_participants_yes} чел. (+{total_guests})")
+        else:
+            results.append(f"✅ Будут: {total_participants_yes} чел.")
+        results.append(f"❌ Не будут: {total_no} чел.")
+        results.append(f"✍️ Резерв: {total_reserve} чел.")
+        results.append(f"📊 Всего участников: {total_yes_with_guests} чел.")
+        return "\n".join(results)
+
+
+def _section(header: str, body: str, empty: str = "нет участников") -> str:
+    if body:
+        return f"{header}\n{body}"
+    return f"{header} {empty}"
+
+
+def format_poll_with_results(poll) -> str:
+    """Форматирование сообщения голосования с результатами"""
+    if poll is None or not poll.active_poll:
+        return "🗳️ <b>Голосование завершено</b>"
+    return poll.renderer.poll_text()
+
+
+def format_results(poll, page: int = 0) -> str:
+    """Форматирование страницы результатов голосования"""
+    return poll.renderer.results_page(_clamp_page(page, poll.renderer.page_count()))
+
+
+def format_final_results(poll) -> str:
+    """Результаты голосования одним сообщением, без страниц"""
+    return poll.renderer.final_text()
+
+
+def results_page(poll, page: int) -> Tuple[str, int, int]:
+    """Страница результатов: (текст, номер страницы в допустимых пределах, всего страниц)"""
+    pages = poll.renderer.page_count()
+    page = _clamp_page(page, pages)
+    return poll.renderer.results_page(page), page, pages
+
+
+def stats_page(chicken_coop_stats: dict, page: int) -> Tuple[List[Tuple[int, int]], int, int]:
+    """Записи статистики курятника на странице: кто чаще всех попадал - выше.
+
+    Возвращает ([(user_id, count)], номер страницы в допустимых пределах, всего страниц).
+    """
+    pages = page_count(len(chicken_coop_stats))
+    page = _clamp_page(page, pages)
+    start = page * PAGE_SIZE
+    if start == 0:
+        # Первая страница - частичная сортировка
+        entries = heapq.nlargest(PAGE_SIZE, chicken_coop_stats.items(), key=lambda x: x[1])
+    else:
+        entries = sorted(chicken_coop_stats.items(), key=lambda x: x[1], reverse=True)[start:start + PAGE_SIZE]
+    return entries, page, pages
+
+
+def format_stats(entries: List[Tuple[int, int]], names: dict, page: int = 0, pages: int = 1) -> str:
+    """Страница статистики курятника (entries из stats_page, names: {user_id: имя})"""
+    if not entries:
+        return "📊 <b>Статистика курятника</b>\n\nПока никто не попадал в курятник!"
+    lines = ["📊 <b>Статистика курятника за все время:</b>\n"]
+    for user_id, count in entries:
+        user_name = names.get(user_id) or "Неизвестный"
+        lines.append(f"• {user_name}: {count} раз")
+    if pages > 1:
+        lines.append(f"\nСтраница {page + 1} из {pages}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,251 @@
+import logging
+import queue
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS polls (
+    poll_id INTEGER PRIMARY KEY,
+    chat_id INTEGER NOT NULL,
+    message_id INTEGER,
+    title TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS votes (
+    poll_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    vote_type TEXT NOT NULL,
+    user_name TEXT NOT NULL,
+    guest_count INTEGER NOT NULL,
+    seq INTEGER NOT NULL,
+    timestamp REAL NOT NULL,
+    PRIMARY KEY (poll_id, user_id)
+);
+CREATE TABLE IF NOT EXISTS chicken_coop (
+    poll_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    PRIMARY KEY (poll_id, user_id)
+);
+CREATE TABLE IF NOT EXISTS chicken_coop_stats (
+    chat_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (chat_id, user_id)
+);
+CREATE TABLE IF NOT EXISTS waiting_for_guests (
+    user_id INTEGER PRIMARY KEY,
+    poll_id INTEGER NOT NULL,
+    message_id INTEGER NOT NULL
+);
+"""
+
+# Служебные сообщения для потока записи
+_STOP = object()
+
+
+class MultiStore:
+    """Передает каждое изменение состояния нескольким хранилищам по очереди"""
+
+    def __init__(self, *stores):
+        self.stores = stores
+
+    def __getattr__(self, name):
+        methods = [getattr(store, name) for store in self.stores]
+
+        def call(*args):
+            for method in methods:
+                method(*args)
+        return call
+
+
+class PollStorage:
+    """Долговременное хранение голосований в SQLite (режим WAL).
+
+    Изменения из обработчиков только ставятся в очередь: отдельный поток забирает
+    все накопившиеся операции и фиксирует их одной транзакцией (group commit),
+    поэтому обработчик никогда не ждет fsync. При запуске состояние реестра
+    восстанавливается методом load().
+    """
+
+    def __init__(self, path: str = "polls.db", synchronous: str = "FULL"):
+        self.path = path
+        self.synchronous = synchronous
+        self._queue: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._thread = None
+        self.commits = 0
+        self.written = 0
+        self.commit_seconds = 0.0  # суммарное время транзакций, включая fsync
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.path, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute(f"PRAGMA synchronous={self.synchronous}")
+        db.executescript(_SCHEMA)
+        return db
+
+    def start(self) -> None:
+        """Запустить фоновый поток записи"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="poll-storage", daemon=True)
+            self._thread.start()
+
+    def flush(self, timeout: float = None) -> bool:
+        """Дождаться фиксации всех поставленных в очередь изменений"""
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self) -> None:
+        """Записать оставшиеся изменения и остановить поток"""
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        db = self._connect()
+        stop = False
+        while not stop:
+            batch = [self._queue.get()]
+            # Все, что накопилось за время предыдущей фиксации, уходит одной транзакцией
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            waiters = []
+            operations = []
+            for item in batch:
+                if item is _STOP:
+                    stop = True
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    operations.append(item)
+
+            if operations:
+                started = time.perf_counter()
+                try:
+                    with db:
+                        for sql, params in operations:
+                            db.execute(sql, params)
+                    self.commit_seconds += time.perf_counter() - started
+                    self.commits += 1
+                    self.written += len(operations)
+                except sqlite3.Error as e:
+                    logger.error(f"Ошибка записи голосований в базу: {e}")
+            for waiter in waiters:
+                waiter.set()
+        db.close()
+
+    def _submit(self, sql: str, params: tuple) -> None:
+        self._queue.put((sql, params))
+
+    # Изменения состояния (вызываются из VotingSystem и PollRegistry)
+
+    def poll_created(self, poll, next_poll_id: int) -> None:
+        self._submit("INSERT OR REPLACE INTO polls (poll_id, chat_id, message_id, title) VALUES (?, ?, ?, ?)",
+                     (poll.poll_id, poll.chat_id, poll.message_id, poll.poll_title))
+        self._submit("INSERT OR REPLACE INTO meta (key, value) VALUES ('next_poll_id', ?)", (next_poll_id,))
+
+    def message_attached(self, poll) -> None:
+        self._submit("UPDATE polls SET message_id = ? WHERE poll_id = ?", (poll.message_id, poll.poll_id))
+
+    def vote_cast(self, poll, user_id: int, previous_vote) -> None:
+        self._save_vote(poll, user_id)
+
+    def guests_set(self, poll, user_id: int) -> None:
+        self._save_vote(poll, user_id)
+
+    def _save_vote(self, poll, user_id: int) -> None:
+        vote = poll.voters[user_id]
+        # В памяти время голоса не хранится; в столбец timestamp пишется время записи
+        self._submit("INSERT OR REPLACE INTO votes (poll_id, user_id, vote_type, user_name, guest_count, seq, timestamp) "
+                     "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                     (poll.poll_id, user_id, vote.vote_type, vote.user_name, vote.guest_count, vote.seq, time.time()))
+
+    def vote_removed(self, poll, user_id: int) -> None:
+        self._submit("DELETE FROM votes WHERE poll_id = ? AND user_id = ?", (poll.poll_id, user_id))
+
+    def coop_added(self, poll, user_id: int) -> None:
+        self._submit("INSERT OR IGNORE INTO chicken_coop (poll_id, user_id) VALUES (?, ?)", (poll.poll_id, user_id))
+        self._submit("INSERT OR REPLACE INTO chicken_coop_stats (chat_id, user_id, count) VALUES (?, ?, ?)",
+                     (poll.chat_id, user_id, poll.chicken_coop_stats[user_id]))
+
+    def guests_waiting(self, user_id: int, poll, message_id: int) -> None:
+        self._submit("INSERT OR REPLACE INTO waiting_for_guests (user_id, poll_id, message_id) VALUES (?, ?, ?)",
+                     (user_id, poll.poll_id, message_id))
+
+    def guests_done(self, user_id: int) -> None:
+        self._submit("DELETE FROM waiting_for_guests WHERE user_id = ?", (user_id,))
+
+    def poll_finished(self, poll) -> None:
+        for table in ("polls", "votes", "chicken_coop", "waiting_for_guests"):
+            self._submit(f"DELETE FROM {table} WHERE poll_id = ?", (poll.poll_id,))
+
+    # Восстановление при запуске
+
+    def attach(self, registry) -> None:
+        """Заменить содержимое базы состоянием реестра, восстановленного из другого хранилища.
+
+        Вызывается до start(): все операции попадают в одну транзакцию, поэтому
+        база переходит из старого состояния в новое целиком.
+        """
+        for table in ("meta", "polls", "votes", "chicken_coop", "chicken_coop_stats", "waiting_for_guests"):
+            self._submit(f"DELETE FROM {table}", ())
+        for chat_id, stats in registry._coop_stats.items():
+            for user_id, count in stats.items():
+                self._submit("INSERT INTO chicken_coop_stats (chat_id, user_id, count) VALUES (?, ?, ?)",
+                             (chat_id, user_id, count))
+        for poll in registry.all_polls():
+            self.poll_created(poll, registry._next_poll_id)
+            for user_id in poll.voters:
+                self._save_vote(poll, user_id)
+            for user_id in poll.current_chicken_coop:
+                self._submit("INSERT INTO chicken_coop (poll_id, user_id) VALUES (?, ?)", (poll.poll_id, user_id))
+            for user_id, message_id in poll.waiting_for_guests.items():
+                self.guests_waiting(user_id, poll, message_id)
+        # Без голосований next_poll_id не записан выше
+        self._submit("INSERT OR REPLACE INTO meta (key, value) VALUES ('next_poll_id', ?)",
+                     (registry._next_poll_id,))
+
+    def load(self, registry) -> None:
+        """Восстановить голосования и статистику курятника в пустой реестр (без подключенного хранилища)"""
+        db = self._connect()
+        try:
+            row = db.execute("SELECT value FROM meta WHERE key = 'next_poll_id'").fetchone()
+            if row is not None:
+                registry._next_poll_id = row[0]
+
+            for chat_id, user_id, count in db.execute("SELECT chat_id, user_id, count FROM chicken_coop_stats"):
+                registry.coop_stats(chat_id)[user_id] = count
+
+            polls = {}
+            for poll_id, chat_id, message_id, title in db.execute(
+                    "SELECT poll_id, chat_id, message_id, title FROM polls ORDER BY poll_id"):
+                polls[poll_id] = registry.restore_poll(poll_id, chat_id, message_id, title)
+
+            # Порядок seq восстанавливает порядок голосов внутри корзин
+            for poll_id, user_id, vote_type, user_name, guest_count, seq in db.execute(
+                    "SELECT poll_id, user_id, vote_type, user_name, guest_count, seq FROM votes ORDER BY poll_id, seq"):
+                poll = polls.get(poll_id)
+                if poll is not None:
+                    poll.restore_vote(user_id, user_name, vote_type, guest_count, seq)
+
+            for poll_id, user_id in db.execute("SELECT poll_id, user_id FROM chicken_coop ORDER BY rowid"):
+                poll = polls.get(poll_id)
+                if poll is not None:
+                    poll.current_chicken_coop[user_id] = None
+
+            for user_id, poll_id, message_id in db.execute(
+                    "SELECT user_id, poll_id, message_id FROM waiting_for_guests"):
+                poll = polls.get(poll_id)
+                if poll is not None:
+                    registry.restore_guests_wait(user_id, poll, message_id)
+        finally:
+            db.close()
+        logger.info(f"Восстановлено голосований из базы: {len(polls)}")
@@ -0,0 +1,286 @@
+import sys
+from typing import Dict, Optional, Tuple
+
+from rendering import PollRenderer
+
+# Один экземпляр строки на тип голоса, в том числе для голосов, прочитанных с диска
+_VOTE_TYPES = {vote_type: sys.intern(vote_type) for vote_type in ("yes", "no", "reserve")}
+
+
+class Vote:
+    """Голос одного пользователя.
+
+    Запись без __dict__: вместо кортежа (имя, гости, datetime) и отдельного индекса
+    хранится один объект на голосующего, а время нажатия заменено порядковым номером.
+    """
+
+    __slots__ = ("user_id", "user_name", "vote_type", "guest_count", "seq")
+
+    def __init__(self, user_id: int, user_name: str, vote_type: str, guest_count: int, seq: int):
+        self.user_id = user_id
+        self.user_name = user_name
+        self.vote_type = vote_type
+        self.guest_count = guest_count
+        self.seq = seq
+
+
+class VoteBucket(dict):
+    """Голоса одной корзины в порядке нажатия: {user_id: Vote}.
+
+    Словарь хранит порядок вставки, поэтому добавление нового голоса в конец,
+    удаление при смене голоса и обход по порядку - O(1) на голос, без сортировки
+    при отрисовке. Изменение гостей меняет запись на месте и не двигает ее.
+    Голоса, восстановленные не по порядку seq, вставляются на свое место.
+    """
+
+    __slots__ = ("_last_seq",)
+
+    def __init__(self):
+        super().__init__()
+        self._last_seq = -1  # наибольший seq среди добавленных голосов
+
+    def add(self, vote: Vote) -> None:
+        """Добавить голос; новые голоса всегда идут в конец"""
+        if vote.seq > self._last_seq:
+            self._last_seq = vote.seq
+            self[vote.user_id] = vote
+            return
+        # Только при восстановлении: голос старше последнего - пересобираем порядок
+        self.pop(vote.user_id, None)
+        ordered = sorted((*self.values(), vote), key=lambda item: item.seq)
+        self.clear()
+        self.update((item.user_id, item) for item in ordered)
+
+
+def _new_buckets() -> Dict[str, VoteBucket]:
+    return {"yes": VoteBucket(), "no": VoteBucket(), "reserve": VoteBucket()}
+
+
+class VotingSystem:
+    def __init__(self, chat_id=None, poll_id=None, chicken_coop_stats=None, store=None):
+        self.poll_id = poll_id
+        self.active_poll = False
+        self.poll_title = ""
+        # Голоса по корзинам в порядке нажатия, идентификаторы пользователей - int
+        self.votes: Dict[str, VoteBucket] = _new_buckets()
+        # Индекс текущих голосов: корзина, гости и порядковый номер без перебора self.votes
+        self.voters: Dict[int, Vote] = {}
+        self._next_seq = 0
+        self.total_guests = 0  # сумма гостей в "Буду", поддерживается при каждом изменении
+        # Статистика курятника общая для всех голосований чата
+        self.chicken_coop_stats = chicken_coop_stats if chicken_coop_stats is not None else {}  # {user_id: count}
+        self.current_chicken_coop = {}  # {user_id: None} - упорядоченное множество в порядке попадания
+        self.message_id = None
+        self.chat_id = chat_id
+        self.waiting_for_guests = {}  # {user_id: message_id}
+        self.renderer = PollRenderer(self)
+        # Хранилище, получающее каждое изменение (None - только в памяти)
+        self.store = store
+
+    def reset(self):
+        self.active_poll = False
+        self.poll_title = ""
+        self.votes = _new_buckets()
+        self.voters = {}
+        self._next_seq = 0
+        self.total_guests = 0
+        self.current_chicken_coop = {}
+        self.message_id = None
+        self.chat_id = None
+        self.waiting_for_guests = {}
+        self.renderer.invalidate()
+
+    def current_vote(self, user_id: int) -> Optional[str]:
+        """Текущий голос пользователя ("yes", "no", "reserve") или None"""
+        vote = self.voters.get(user_id)
+        return vote.vote_type if vote is not None else None
+
+    def display_name(self, user_id: int) -> Optional[str]:
+        """Имя пользователя из его текущего голоса"""
+        vote = self.voters.get(user_id)
+        return vote.user_name if vote is not None else None
+
+    def remove_vote(self, user_id: int) -> Optional[str]:
+        """Удалить текущий голос пользователя, вернуть его тип"""
+        vote_key = self._pop_vote(user_id)
+        if vote_key is not None and self.store is not None:
+            self.store.vote_removed(self, user_id)
+        return vote_key
+
+    def _pop_vote(self, user_id: int) -> Optional[str]:
+        vote = self.voters.pop(user_id, None)
+        if vote is None:
+            return None
+        del self.votes[vote.vote_type][user_id]
+        self.total_guests -= vote.guest_count
+        self.renderer.invalidate(vote.vote_type, "totals")
+        return vote.vote_type
+
+    def cast_vote(self, user_id: int, user_name: str, vote_type: str) -> None:
+        """Записать голос пользователя (по умолчанию 0 гостей)"""
+        previous_vote = self._pop_vote(user_id)
+        vote = Vote(user_id, sys.intern(user_name), _VOTE_TYPES[vote_type], 0, self._next_seq)
+        self._next_seq += 1
+        self.votes[vote.vote_type].add(vote)
+        self.voters[user_id] = vote
+        self.renderer.invalidate(vote.vote_type, "totals")
+        if user_id in self.current_chicken_coop:
+            # Имя в курятнике берется из текущего голоса
+            self.renderer.invalidate("coop")
+        if self.store is not None:
+            self.store.vote_cast(self, user_id, previous_vote)
+
+    def set_guests(self, user_id: int, guest_count: int) -> bool:
+        """Обновить количество гостей; позиция в списке "Буду" не меняется"""
+        vote = self.voters.get(user_id)
+        if vote is None or vote.vote_type != "yes":
+            return False
+        self.total_guests += guest_count - vote.guest_count
+        vote.guest_count = guest_count
+        self.renderer.invalidate("yes", "totals")
+        if self.store is not None:
+            self.store.guests_set(self, user_id)
+        return True
+
+    def add_to_chicken_coop(self, user_id: int) -> None:
+        """Отправить пользователя в курятник"""
+        self.current_chicken_coop[user_id] = None
+        self.chicken_coop_stats[user_id] = self.chicken_coop_stats.get(user_id, 0) + 1
+        self.renderer.invalidate("coop")
+        if self.store is not None:
+            self.store.coop_added(self, user_id)
+
+    def restore_vote(self, user_id: int, user_name: str, vote_type: str, guest_count: int, seq: int) -> None:
+        """Восстановить сохраненный голос без записи в хранилище"""
+        vote = Vote(user_id, sys.intern(user_name), _VOTE_TYPES[vote_type], guest_count, seq)
+        self.votes[vote.vote_type].add(vote)
+        self.voters[user_id] = vote
+        self.total_guests += guest_count
+        self._next_seq = max(self._next_seq, seq + 1)
+        self.renderer.invalidate()
+
+
+class PollRegistry:
+    """Реестр голосований: несколько опросов в каждом чате, поиск по сообщению за O(1)"""
+
+    def __init__(self, store=None):
+        self.store = store  # хранилище голосований (None - только в памяти)
+        self._by_message: Dict[Tuple[int, int], VotingSystem] = {}  # {(chat_id, message_id): poll}
+        self._by_chat: Dict[int, Dict[int, VotingSystem]] = {}  # {chat_id: {poll_id: poll}}
+        self._by_id: Dict[int, VotingSystem] = {}  # {poll_id: poll}
+        self._coop_stats: Dict[int, dict] = {}  # {chat_id: {user_id: count}}
+        self._waiting_for_guests: Dict[int, VotingSystem] = {}  # {user_id: poll}
+        self._next_poll_id = 1
+
+    def __len__(self) -> int:
+        return len(self._by_message)
+
+    def set_store(self, store) -> None:
+        """Подключить хранилище ко всем голосованиям (после восстановления состояния)"""
+        self.store = store
+        for poll in self._by_id.values():
+            poll.store = store
+
+    def all_polls(self) -> list:
+        """Все активные голосования во всех чатах"""
+        return list(self._by_id.values())
+
+    def create(self, chat_id: int, title: str) -> VotingSystem:
+        """Создать новое активное голосование в чате"""
+        poll = VotingSystem(chat_id=chat_id, poll_id=self._next_poll_id,
+                            chicken_coop_stats=self.coop_stats(chat_id), store=self.store)
+        self._next_poll_id += 1
+        poll.poll_title = title
+        poll.active_poll = True
+        self._by_chat.setdefault(chat_id, {})[poll.poll_id] = poll
+        self._by_id[poll.poll_id] = poll
+        if self.store is not None:
+            self.store.poll_created(poll, self._next_poll_id)
+        return poll
+
+    def restore_poll(self, poll_id: int, chat_id: int, message_id: Optional[int], title: str) -> VotingSystem:
+        """Восстановить сохраненное голосование без записи в хранилище"""
+        poll = VotingSystem(chat_id=chat_id, poll_id=poll_id,
+                            chicken_coop_stats=self.coop_stats(chat_id), store=self.store)
+        poll.poll_title = title
+        poll.active_poll = True
+        self._by_chat.setdefault(chat_id, {})[poll_id] = poll
+        self._by_id[poll_id] = poll
+        if message_id is not None:
+            poll.message_id = message_id
+            self._by_message[(chat_id, message_id)] = poll
+        self._next_poll_id = max(self._next_poll_id, poll_id + 1)
+        return poll
+
+    def restore_guests_wait(self, user_id: int, poll: VotingSystem, message_id: int) -> None:
+        poll.waiting_for_guests[user_id] = message_id
+        self._waiting_for_guests[user_id] = poll
+
+    def attach_message(self, poll: VotingSystem, message_id: int) -> None:
+        """Привязать голосование к сообщению, в котором оно отображается"""
+        if poll.message_id is not None:
+            self._by_message.pop((poll.chat_id, poll.message_id), None)
+        poll.message_id = message_id
+        self._by_message[(poll.chat_id, message_id)] = poll
+        if self.store is not None:
+            self.store.message_attached(poll)
+
+    def get(self, chat_id: int, message_id: int) -> Optional[VotingSystem]:
+        """Голосование, которому принадлежит сообщение"""
+        return self._by_message.get((chat_id, message_id))
+
+    def get_by_id(self, poll_id: int) -> Optional[VotingSystem]:
+        return self._by_id.get(poll_id)
+
+    def chat_polls(self, chat_id: int) -> list:
+        """Все активные голосования чата"""
+        return list(self._by_chat.get(chat_id, {}).values())
+
+    def latest(self, chat_id: int) -> Optional[VotingSystem]:
+        """Последнее созданное активное голосование чата"""
+        chat_polls = self._by_chat.get(chat_id)
+        if not chat_polls:
+            return None
+        return chat_polls[max(chat_polls)]
+
+    def coop_stats(self, chat_id: int) -> dict:
+        """Статистика курятника чата за все время"""
+        return self._coop_stats.setdefault(chat_id, {})
+
+    def wait_for_guests(self, user_id: int, poll: VotingSystem, message_id: int) -> None:
+        """Запомнить, что пользователь вводит количество гостей для голосования"""
+        previous = self._waiting_for_guests.get(user_id)
+        if previous is not None and previous is not poll:
+            previous.waiting_for_guests.pop(user_id, None)
+        poll.waiting_for_guests[user_id] = message_id
+        self._waiting_for_guests[user_id] = poll
+        if self.store is not None:
+            self.store.guests_waiting(user_id, poll, message_id)
+
+    def guests_poll(self, user_id: int) -> Optional[VotingSystem]:
+        """Голосование, для которого пользователь вводит гостей"""
+        return self._waiting_for_guests.get(user_id)
+
+    def stop_waiting_for_guests(self, user_id: int) -> None:
+        poll = self._waiting_for_guests.pop(user_id, None)
+        if poll is not None:
+            poll.waiting_for_guests.pop(user_id, None)
+            if self.store is not None:
+                self.store.guests_done(user_id)
+
+    def finish(self, poll: VotingSystem) -> None:
+        """Удалить голосование из реестра и сбросить его состояние"""
+        for user_id in poll.waiting_for_guests:
+            if self._waiting_for_guests.get(user_id) is poll:
+                del self._waiting_for_guests[user_id]
+        if poll.message_id is not None:
+            self._by_message.pop((poll.chat_id, poll.message_id), None)
+        chat_polls = self._by_chat.get(poll.chat_id)
+        if chat_polls is not None:
+            chat_polls.pop(poll.poll_id, None)
+            if not chat_polls:
+                del self._by_chat[poll.chat_id]
+        self._by_id.pop(poll.poll_id, None)
+        if self.store is not None:
+            self.store.poll_finished(poll)
+        poll.reset()
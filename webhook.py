@@ -0,0 +1,205 @@
+import asyncio
+import hmac
+import json
+import logging
+import signal
+from typing import Optional
+
+from telegram import Update
+
+from decoding import LazyUpdatesBot
+
+logger = logging.getLogger(__name__)
+
+_REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    403: "Forbidden",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    411: "Length Required",
+    413: "Payload Too Large",
+}
+
+
+def _response(status: int, close: bool) -> bytes:
+    connection = "close" if close else "keep-alive"
+    return (f"HTTP/1.1 {status} {_REASONS[status]}\r\n"
+            f"Content-Length: 0\r\nConnection: {connection}\r\n\r\n").encode("ascii")
+
+
+# Ответы без тела собираются один раз
+_RESPONSES = {(status, close): _response(status, close) for status in _REASONS for close in (False, True)}
+
+# Сколько секунд stop() ждет завершения обработчиков соединений
+STOP_TIMEOUT = 5.0
+
+
+class WebhookServer:
+    """Прием вебхуков Telegram на asyncio streams, без tornado.
+
+    Соединения поддерживают keep-alive и конвейерную отправку запросов: запросы
+    читаются из потока по очереди, ответы пишутся в том же порядке. Проверяется
+    секретный токен из X-Telegram-Bot-Api-Secret-Token, тело разбирается как JSON
+    и обновление сразу кладется в application.update_queue.
+    """
+
+    def __init__(self, application, listen: str = "0.0.0.0", port: int = 8443, url_path: str = "/telegram",
+                 secret_token: Optional[str] = None, max_body_size: int = 1 << 20):
+        self.application = application
+        self.listen = listen
+        self.port = port
+        self.url_path = "/" + url_path.lstrip("/")
+        self.secret_token = secret_token.encode() if secret_token else None
+        self.max_body_size = max_body_size
+        self.received = 0
+        self.rejected = 0
+        self._server = None
+        self._writers = set()  # открытые соединения: keep-alive держит их после ответа
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle_connection, self.listen, self.port)
+        # При port=0 система выбирает свободный порт
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"Вебхук-сервер слушает {self.listen}:{self.port}{self.url_path}")
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            # С Python 3.12 wait_closed ждет все соединения, а keep-alive соединение
+            # Telegram висит в readline до закрытия - закрываем их сами.
+            # Ответ на запрос, обрабатываемый в этот момент, теряется - Telegram его повторит
+            for writer in list(self._writers):
+                writer.close()
+            try:
+                await asyncio.wait_for(self._server.wait_closed(), STOP_TIMEOUT)
+            except asyncio.TimeoutError:
+                logger.warning("Соединения вебхук-сервера не закрылись вовремя")
+            self._server = None
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._writers.add(writer)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                parts = request_line.split()
+                if len(parts) != 3:
+                    writer.write(_RESPONSES[(400, True)])
+                    break
+                method, target, version = parts
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.partition(b":")
+                    headers[name.strip().lower()] = value.strip()
+
+                connection = headers.get(b"connection", b"").lower()
+                if version == b"HTTP/1.1":
+                    keep_alive = connection != b"close"
+                else:
+                    keep_alive = connection == b"keep-alive"
+
+                if b"content-length" not in headers:
+                    writer.write(_RESPONSES[(411, True)])
+                    break
+                length = int(headers[b"content-length"])
+                if length > self.max_body_size:
+                    writer.write(_RESPONSES[(413, True)])
+                    break
+                body = await reader.readexactly(length) if length else b""
+
+                status = self._process(method, target, headers, body)
+                writer.write(_RESPONSES[(status, not keep_alive)])
+                if not keep_alive:
+                    break
+                # drain ждет, только если клиент не успевает читать ответы
+                await writer.drain()
+            await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    def _process(self, method: bytes, target: bytes, headers: dict, body: bytes) -> int:
+        if target.split(b"?", 1)[0].decode("latin-1") != self.url_path:
+            return 404
+        if method != b"POST":
+            return 405
+        if self.secret_token is not None:
+            token = headers.get(b"x-telegram-bot-api-secret-token", b"")
+            if not hmac.compare_digest(token, self.secret_token):
+                self.rejected += 1
+                logger.warning("Запрос к вебхуку с неверным секретным токеном")
+                return 403
+        try:
+            data = json.loads(body)
+        except ValueError:
+            return 400
+        if not isinstance(data, dict):
+            return 400
+
+        bot = self.application.bot
+        try:
+            if isinstance(bot, LazyUpdatesBot):
+                # Предварительный фильтр и частичный разбор; ненужное обновление подтверждается без обработки
+                if not bot.accepts(data):
+                    return 200
+                update = bot.decode(data)
+            else:
+                update = Update.de_json(data, bot)
+        except Exception as e:
+            # Ошибка разбора не должна обрывать соединение, по которому идут и другие обновления
+            self.rejected += 1
+            logger.error(f"Не удалось разобрать обновление из вебхука: {e}")
+            return 400
+        self.received += 1
+        self.application.update_queue.put_nowait(update)
+        return 200
+
+
+def run_webhook(application, webhook_url: str, listen: str = "0.0.0.0", port: int = 8443,
+                url_path: str = "/telegram", secret_token: Optional[str] = None) -> None:
+    """Запуск бота в режиме вебхука (замена application.run_webhook без tornado)"""
+    asyncio.run(_serve_webhook(application, webhook_url, listen, port, url_path, secret_token))
+
+
+async def _serve_webhook(application, webhook_url: str, listen: str, port: int, url_path: str,
+                         secret_token: Optional[str]) -> None:
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            # Windows: остановка по KeyboardInterrupt
+            pass
+
+    server = WebhookServer(application, listen, port, url_path, secret_token)
+    # Тот же порядок запуска и остановки, что и в Application.run_webhook
+    await application.initialize()
+    try:
+        if application.post_init:
+            await application.post_init(application)
+        await server.start()
+        await application.bot.set_webhook(
+            url=webhook_url.rstrip("/") + server.url_path,
+            secret_token=secret_token,
+            allowed_updates=Update.ALL_TYPES
+        )
+        await application.start()
+        await stop.wait()
+    finally:
+        await server.stop()
+        if application.running:
+            await application.stop()
+            if application.post_stop:
+                await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)